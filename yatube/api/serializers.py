@@ -0,0 +1,56 @@
+"""Преобразование моделей в словари для JSON-ответов.
+
+Каждое поле описано функцией от объекта, поэтому ?fields=id,text
+просто выбирает нужные функции. DEFERRABLE перечисляет тяжёлые колонки,
+которые не читаются из базы, если их поле не запрошено.
+"""
+POST_FIELDS = {
+    'id': lambda post: post.pk,
+    'text': lambda post: post.text,
+    'pub_date': lambda post: post.pub_date.isoformat(),
+    'author': lambda post: post.author.username,
+    'group': lambda post: post.group.slug if post.group_id else None,
+    'image': lambda post: post.image.url if post.image else None,
+    'comment_count': lambda post: post.comment_count,
+}
+
+POST_DEFERRABLE = {
+    'text': 'text',
+    'image': 'image',
+}
+
+GROUP_FIELDS = {
+    'id': lambda group: group.pk,
+    'title': lambda group: group.title,
+    'slug': lambda group: group.slug,
+    'description': lambda group: group.description,
+}
+
+PROFILE_FIELDS = {
+    'id': lambda user: user.pk,
+    'username': lambda user: user.username,
+    'full_name': lambda user: user.get_full_name(),
+    'rating': lambda user: user.profile.score,
+    'post_count': lambda user: user.profile.post_count,
+    'follower_count': lambda user: user.profile.follower_count,
+    'following_count': lambda user: user.profile.following_count,
+}
+
+
+class FieldError(ValueError):
+    pass
+
+
+def parse_fields(value, available):
+    """Список полей из ?fields=; без параметра — все поля."""
+    if not value:
+        return list(available)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise FieldError(f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def serialize(obj, fields, available):
+    return {field: available[field](obj) for field in fields}
@@ -0,0 +1,192 @@
+import csv
+import gzip
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(title='Группа', slug='test_slug',
+                                         description='Описание')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.posts = [Post.objects.create(text=f'Пост {i}', author=cls.author,
+                                         group=cls.group)
+                     for i in range(5)]
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def get_json(self, url, client=None, **params):
+        response = (client or self.guest_client).get(url, params)
+        content = b''.join(response.streaming_content
+                           if response.streaming else [response.content])
+        return response, json.loads(content)
+
+    def test_lists_walk_by_cursor(self):
+        urls = [
+            reverse('api:post_list'),
+            reverse('api:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('api:profile_posts', kwargs={'username': self.author}),
+        ]
+        expected = [post.pk for post in reversed(self.posts)]
+        for url in urls:
+            with self.subTest(url=url):
+                seen = []
+                params = {'limit': 2}
+                while True:
+                    _, data = self.get_json(url, **params)
+                    seen += [post['id'] for post in data['results']]
+                    if not data['next']:
+                        break
+                    params['cursor'] = data['next']
+                self.assertEqual(seen, expected)
+
+    def test_follow_feed_requires_login(self):
+        url = reverse('api:follow_feed')
+        self.assertEqual(self.guest_client.get(url).status_code, 401)
+        _, data = self.get_json(url, self.authorized_client)
+        self.assertEqual(len(data['results']), 5)
+
+    def test_sparse_fields(self):
+        _, data = self.get_json(reverse('api:post_list'), fields='id,author')
+        self.assertEqual(data['results'][0],
+                         {'id': self.posts[-1].pk, 'author': 'Author'})
+        response = self.guest_client.get(reverse('api:post_list'),
+                                         {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_lookup_by_ids(self):
+        ids = [self.posts[2].pk, 999999, self.posts[0].pk]
+        # Авторы для ETag и сами посты.
+        with self.assertNumQueries(2):
+            _, data = self.get_json(reverse('api:post_list'),
+                                    ids=','.join(map(str, ids)))
+        self.assertEqual([post['id'] for post in data['results']],
+                         [self.posts[2].pk, self.posts[0].pk])
+        self.assertEqual(data['missing'], [999999])
+
+    def test_detail_endpoints(self):
+        _, data = self.get_json(
+            reverse('api:profile_detail', kwargs={'username': self.author})
+        )
+        self.assertEqual(data['post_count'], 5)
+        self.assertEqual(data['follower_count'], 1)
+        _, data = self.get_json(
+            reverse('api:group_detail', kwargs={'slug': self.group.slug}),
+            fields='slug'
+        )
+        self.assertEqual(data, {'slug': self.group.slug})
+        response = self.guest_client.get(
+            reverse('api:post_detail', kwargs={'post_id': 999999})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_etag(self):
+        url = reverse('api:post_detail', kwargs={'post_id': self.posts[0].pk})
+        etag = self.guest_client.get(url)['ETag']
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.posts[0].text = 'Новый текст'
+        self.posts[0].save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_lookup_etag_changes_after_author_rename(self):
+        author = User.objects.create_user(username='OldName')
+        post = Post.objects.create(text='Пост', author=author)
+        url = reverse('api:post_list')
+        response, _ = self.get_json(url, ids=post.pk)
+        author.username = 'NewName'
+        author.save()
+        response = self.guest_client.get(
+            url, {'ids': post.pk}, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['results'][0]['author'], 'NewName')
+
+    def test_follower_profile_etag_changes_after_unfollow(self):
+        url = reverse('api:profile_detail', kwargs={'username': self.user})
+        response, data = self.get_json(url)
+        self.assertEqual(data['following_count'], 1)
+        Follow.objects.filter(user=self.user, author=self.author).delete()
+        response = self.guest_client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['following_count'], 0)
+
+    def export(self, url, client, **params):
+        response = client.get(url, params)
+        return response, b''.join(response.streaming_content)
+
+    def test_export_permissions(self):
+        author_client = Client()
+        author_client.force_login(self.author)
+        staff = User.objects.create_user(username='Staff', is_staff=True)
+        staff_client = Client()
+        staff_client.force_login(staff)
+        profile_url = reverse('api:profile_export',
+                              kwargs={'username': self.author})
+        group_url = reverse('api:group_export',
+                            kwargs={'slug': self.group.slug})
+        cases = [
+            (profile_url, self.guest_client, 401),
+            (profile_url, self.authorized_client, 403),
+            (profile_url, author_client, 200),
+            (profile_url, staff_client, 200),
+            (group_url, author_client, 403),
+            (group_url, staff_client, 200),
+        ]
+        for url, client, status in cases:
+            with self.subTest(url=url, status=status):
+                self.assertEqual(client.get(url).status_code, status)
+
+    def test_export_formats(self):
+        Comment.objects.create(text='Комментарий', post=self.posts[0],
+                               author=self.user)
+        client = Client()
+        client.force_login(self.author)
+        url = reverse('api:profile_export', kwargs={'username': self.author})
+        response, content = self.export(url, client)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(
+            [record['type'] for record in records],
+            ['user', 'user', 'group'] + ['post'] * 5 + ['comment']
+        )
+        self.assertEqual(records[-1]['post'], self.posts[0].pk)
+        users = {record['username']: record for record in records[:2]}
+        self.assertEqual(users[self.user.username],
+                         {'type': 'user', 'username': self.user.username})
+        self.assertIn('date_joined', users[self.author.username])
+        staff = Client()
+        staff.force_login(User.objects.create_user(username='Staff',
+                                                   is_staff=True))
+        _, staff_content = self.export(url, staff)
+        self.assertIn('date_joined',
+                      json.loads(staff_content.decode().splitlines()[1]))
+        _, gzipped = self.export(url, client, gzip=1)
+        self.assertEqual(gzip.decompress(gzipped), content)
+        _, csv_content = self.export(url, client, format='csv')
+        rows = list(csv.DictReader(io.StringIO(csv_content.decode())))
+        self.assertEqual(len(rows), len(records))
+        self.assertEqual(rows[3]['text'], 'Пост 0')
+        response = client.get(url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
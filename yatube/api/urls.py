@@ -0,0 +1,21 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', views.post_list, name='post_list'),
+    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('groups/<slug:slug>/', views.group_detail, name='group_detail'),
+    path('groups/<slug:slug>/posts/', views.group_posts, name='group_posts'),
+    path('groups/<slug:slug>/export/',
+         views.group_export, name='group_export'),
+    path('profiles/<str:username>/',
+         views.profile_detail, name='profile_detail'),
+    path('profiles/<str:username>/posts/',
+         views.profile_posts, name='profile_posts'),
+    path('profiles/<str:username>/export/',
+         views.profile_export, name='profile_export'),
+    path('follow/', views.follow_feed, name='follow_feed'),
+]
@@ -0,0 +1,246 @@
+import json
+from functools import partial
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_safe
+
+from posts import caching, export, feed
+from posts.models import Group, Post, User
+from posts.pagination import cursor_page
+from posts.views import group_etag, index_etag, post_etag, profile_etag
+
+from .serializers import (GROUP_FIELDS, POST_DEFERRABLE, POST_FIELDS,
+                          PROFILE_FIELDS, FieldError, parse_fields,
+                          serialize)
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def dumps(data):
+    return json.dumps(data, ensure_ascii=False)
+
+
+def stream_results(objects, fields, available, **extra):
+    """Пишет {"results": [...], ...} по одному объекту за раз."""
+    yield '{"results": ['
+    for index, obj in enumerate(objects):
+        if index:
+            yield ','
+        yield dumps(serialize(obj, fields, available))
+    yield ']'
+    for key, value in extra.items():
+        yield f', {dumps(key)}: {dumps(value)}'
+    yield '}'
+
+
+def streaming_json(content):
+    return StreamingHttpResponse(content,
+                                 content_type='application/json')
+
+
+def get_limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.POSTS_PER_SITE))
+    except ValueError:
+        raise FieldError('limit должен быть числом')
+    if not 1 <= limit <= settings.API_MAX_LIMIT:
+        raise FieldError(f'limit должен быть от 1 до '
+                         f'{settings.API_MAX_LIMIT}')
+    return limit
+
+
+def post_fields(request, queryset):
+    """Запрошенные поля поста и queryset без ненужных тяжёлых колонок."""
+    fields = parse_fields(request.GET.get('fields'), POST_FIELDS)
+    deferred = [column for field, column in POST_DEFERRABLE.items()
+                if field not in fields]
+    return fields, queryset.defer(*deferred)
+
+
+def posts_page(request, queryset, paginate=cursor_page):
+    try:
+        limit = get_limit(request)
+        fields, queryset = post_fields(request, queryset)
+    except FieldError as exc:
+        return error(str(exc))
+    page_obj = paginate(queryset, request.GET.get('cursor'), limit)
+    return streaming_json(stream_results(
+        page_obj, fields, POST_FIELDS,
+        next=page_obj.next_cursor, previous=page_obj.previous_cursor,
+    ))
+
+
+def parse_ids(value):
+    try:
+        ids = [int(pk) for pk in value.split(',') if pk.strip()]
+    except ValueError:
+        raise FieldError('ids должен быть списком чисел через запятую')
+    if not ids or len(ids) > settings.API_MAX_IDS:
+        raise FieldError(f'ids: от 1 до {settings.API_MAX_IDS} значений')
+    return list(dict.fromkeys(ids))
+
+
+def posts_by_ids(request):
+    """Посты по списку id одним запросом, в порядке запроса."""
+    try:
+        ids = parse_ids(request.GET['ids'])
+        fields, queryset = post_fields(request, Post.objects.for_list())
+    except FieldError as exc:
+        return error(str(exc))
+    posts = queryset.in_bulk(ids)
+    return streaming_json(stream_results(
+        (posts[pk] for pk in ids if pk in posts), fields, POST_FIELDS,
+        missing=[pk for pk in ids if pk not in posts],
+    ))
+
+
+def posts_etag(request):
+    if 'ids' not in request.GET:
+        return index_etag(request)
+    try:
+        ids = parse_ids(request.GET['ids'])
+    except FieldError:
+        return None
+    # Карточка поста содержит автора: его переименование тоже меняет ответ.
+    author_ids = (Post.objects.filter(pk__in=ids)
+                  .values_list('author_id', flat=True).distinct())
+    return caching.etag(request, [
+        *(f'post:{pk}' for pk in ids),
+        *(f'author:{pk}' for pk in sorted(author_ids)),
+    ])
+
+
+@require_safe
+@condition(etag_func=posts_etag)
+def post_list(request):
+    if 'ids' in request.GET:
+        return posts_by_ids(request)
+    return posts_page(request, Post.objects.for_list())
+
+
+@require_safe
+@condition(etag_func=post_etag)
+def post_detail(request, post_id):
+    try:
+        fields, queryset = post_fields(request, Post.objects.for_list())
+    except FieldError as exc:
+        return error(str(exc))
+    post = queryset.filter(pk=post_id).first()
+    if post is None:
+        return error('Пост не найден', status=404)
+    return JsonResponse(serialize(post, fields, POST_FIELDS),
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def find_group(slug):
+    return Group.objects.filter(slug=slug).first()
+
+
+@require_safe
+@condition(etag_func=group_etag)
+def group_detail(request, slug):
+    group = find_group(slug)
+    if group is None:
+        return error('Группа не найдена', status=404)
+    try:
+        fields = parse_fields(request.GET.get('fields'), GROUP_FIELDS)
+    except FieldError as exc:
+        return error(str(exc))
+    return JsonResponse(serialize(group, fields, GROUP_FIELDS),
+                        json_dumps_params={'ensure_ascii': False})
+
+
+@require_safe
+@condition(etag_func=group_etag)
+def group_posts(request, slug):
+    group = find_group(slug)
+    if group is None:
+        return error('Группа не найдена', status=404)
+    return posts_page(request, group.posts.for_list())
+
+
+def find_author(username):
+    return (User.objects.select_related('profile')
+            .filter(username=username).first())
+
+
+@require_safe
+@condition(etag_func=profile_etag)
+def profile_detail(request, username):
+    author = find_author(username)
+    if author is None:
+        return error('Пользователь не найден', status=404)
+    try:
+        fields = parse_fields(request.GET.get('fields'), PROFILE_FIELDS)
+    except FieldError as exc:
+        return error(str(exc))
+    return JsonResponse(serialize(author, fields, PROFILE_FIELDS),
+                        json_dumps_params={'ensure_ascii': False})
+
+
+@require_safe
+@condition(etag_func=profile_etag)
+def profile_posts(request, username):
+    author = find_author(username)
+    if author is None:
+        return error('Пользователь не найден', status=404)
+    return posts_page(request, author.posts.for_list())
+
+
+@require_safe
+def follow_feed(request):
+    # Лента личная и собирается из постов многих авторов, поэтому без ETag.
+    if not request.user.is_authenticated:
+        return error('Нужно войти', status=401)
+    return posts_page(request, Post.objects.for_list(),
+                      partial(feed.feed_page, request.user))
+
+
+def export_response(request, rows, name):
+    """Отдаёт выгрузку потоком; ?format=ndjson|csv, ?gzip=1 сжимает её."""
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in export.FORMATS:
+        return error(f'format: одно из {", ".join(export.FORMATS)}')
+    filename = f'{name}.{export_format}'
+    chunks = export.encode(export.render(rows, export_format))
+    content_type = export.FORMATS[export_format]
+    if request.GET.get('gzip') == '1':
+        chunks = export.gzip_chunks(chunks)
+        filename += '.gz'
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@require_safe
+def profile_export(request, username):
+    # Полную выгрузку своих постов получает автор, чужих — только персонал.
+    if not request.user.is_authenticated:
+        return error('Нужно войти', status=401)
+    author = User.objects.filter(username=username).first()
+    if author is None:
+        return error('Пользователь не найден', status=404)
+    if request.user != author and not request.user.is_staff:
+        return error('Нет доступа', status=403)
+    return export_response(request,
+                           export.author_records(author, request.user),
+                           f'posts-{author.pk}')
+
+
+@require_safe
+def group_export(request, slug):
+    if not request.user.is_authenticated:
+        return error('Нужно войти', status=401)
+    if not request.user.is_staff:
+        return error('Нет доступа', status=403)
+    group = find_group(slug)
+    if group is None:
+        return error('Группа не найдена', status=404)
+    return export_response(request,
+                           export.group_records(group, request.user),
+                           f'group-{group.slug}')
@@ -0,0 +1,13 @@
+from functools import partial
+
+from django.conf import settings
+
+from posts import leaderboard
+
+
+def top_authors(request):
+    """Добавляет лидеров рейтинга для шапки; читаются только при выводе."""
+    return {
+        'top_authors': partial(leaderboard.top,
+                               settings.LEADERBOARD_WIDGET_SIZE)
+    }
@@ -0,0 +1,55 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+
+from posts import caching
+
+PAGE_KEY = 'page:{}'
+
+
+class AnonymousPageCacheMiddleware:
+    """Кеширует целые страницы для анонимных посетителей.
+
+    Кешируются только ответы представлений, отмеченных тегами через
+    posts.caching.tag_request. Вместе со страницей хранятся поколения её
+    тегов; если хоть один тег с тех пор изменился, страница строится
+    заново. Ответы с cookie или CSRF-токеном не кешируются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.can_use_cache(request):
+            return self.get_response(request)
+        key = PAGE_KEY.format(
+            hashlib.md5(request.get_full_path().encode()).hexdigest()
+        )
+        entry = cache.get(key)
+        if entry is not None:
+            tags, response = entry
+            if caching.versions(tags) == tags:
+                return get_conditional_response(
+                    request, etag=response.get('ETag'), response=response
+                )
+        response = self.get_response(request)
+        tags = getattr(request, 'cache_tags', None)
+        if tags and self.can_store(request, response):
+            cache.set(key, (tags, response), settings.PAGE_CACHE_TIMEOUT)
+        return response
+
+    @staticmethod
+    def can_use_cache(request):
+        return (request.method in ('GET', 'HEAD')
+                and not request.user.is_authenticated)
+
+    @staticmethod
+    def can_store(request, response):
+        return (request.method == 'GET'
+                and response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and not request.META.get('CSRF_COOKIE_USED')
+                and not request.user.is_authenticated)
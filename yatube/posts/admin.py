@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Comment, Follow, Group, Post, Rating, SetRating
+from . import search
+from .models import Comment, Follow, Group, Post, Profile, Rating, Vote
 
 
 @admin.register(Post)
@@ -17,6 +18,10 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу вместо LIKE '%...%'.
+        return search.filter_posts(queryset, search_term), False
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -59,10 +64,23 @@ class RatingAdmin(admin.ModelAdmin):
     )
 
 
-@admin.register(SetRating)
-class SetRatingAdmin(admin.ModelAdmin):
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'user',
+        'rating',
+    )
+    search_fields = ('user__username',)
+
+
+@admin.register(Vote)
+class VoteAdmin(admin.ModelAdmin):
     list_display = (
         'pk',
         'user',
         'author',
+        'value',
+        'created',
     )
+    list_filter = ('value',)
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from . import signals
+        post_migrate.connect(signals.restore_search_index, sender=self)
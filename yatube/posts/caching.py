@@ -0,0 +1,123 @@
+"""Поколения содержимого страниц для ключей кеша.
+
+У каждого тега — ленты ('index', 'group:<id>', 'author:<id>'), поста
+('post:<id>'), шапки с лидерами ('leaderboard') или всего сайта ('all') —
+есть счётчик в кеше. Ключ закешированного фрагмента включает счётчики
+показанных в нём тегов; изменение модели увеличивает счётчики своих
+тегов, и старые фрагменты просто перестают читаться. Пока ничего не
+менялось, фрагмент живёт PAGE_CACHE_TIMEOUT секунд.
+
+Целые страницы для анонимов кеширует
+core.middleware.AnonymousPageCacheMiddleware: представление отмечает ответ
+тегами лент через tag_request, а после выборки — тегами показанных
+объектов через tag_objects: 'post:<id>' каждого поста и 'user:<id>'
+каждого автора. Правка текста поста или имени пользователя делает
+устаревшими все закешированные страницы, где они выведены. Из тех же
+поколений собирается ETag для условных GET-запросов (см. etag); он
+считается до выборки и поэтому знает только теги лент — такие правки
+увеличивают и их (post_saved, user_saved).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Post
+
+VERSION_KEY = 'version:{}'
+ALL = 'all'
+LEADERBOARD = 'leaderboard'
+
+
+def list_tags(group_id, author_id):
+    """Теги лент, в которые попадает пост."""
+    tags = ['index', f'author:{author_id}']
+    if group_id:
+        tags.append(f'group:{group_id}')
+    return tags
+
+
+def author_tags(author_id):
+    """Теги всех лент, где выводятся посты автора (например, с рейтингом)."""
+    group_ids = (Post.objects.filter(author_id=author_id, group__isnull=False)
+                 .order_by().values_list('group_id', flat=True).distinct())
+    return (['index', f'author:{author_id}']
+            + [f'group:{group_id}' for group_id in group_ids])
+
+
+def _initial():
+    # Счётчик, выпавший из кеша, не должен начаться с уже бывшего значения.
+    return int(time.time() * 1000)
+
+
+def versions(tags):
+    """Возвращает {тег: поколение}, заводя недостающие счётчики."""
+    keys = {tag: VERSION_KEY.format(tag) for tag in tags}
+    found = cache.get_many(keys.values())
+    result = {}
+    for tag, key in keys.items():
+        if key not in found:
+            cache.add(key, _initial(), None)
+            found[key] = cache.get(key)
+        result[tag] = found[key]
+    return result
+
+
+def version_key(tags):
+    """Строка поколений тегов для ключа кеша; всегда учитывает ALL."""
+    tags = [ALL, *tags]
+    current = versions(tags)
+    return '.'.join(str(current[tag]) for tag in tags)
+
+
+def bump(tags):
+    """Делает устаревшим всё, что закешировано с этими тегами."""
+    for tag in tags:
+        key = VERSION_KEY.format(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial(), None)
+
+
+def tag_request(request, tags):
+    """Отмечает ответ тегами и запоминает их поколения до запросов к базе."""
+    request.cache_tags = versions([ALL, LEADERBOARD, *tags])
+
+
+def object_tags(posts):
+    """Теги показанных постов и их авторов."""
+    tags = set()
+    for post in posts:
+        tags.add(f'post:{post.pk}')
+        tags.add(f'user:{post.author_id}')
+    return sorted(tags)
+
+
+def tag_objects(request, tags):
+    """Добавляет к тегам ответа теги объектов, показанных на странице.
+
+    Поколения читаются уже после выборки объектов, поэтому правка,
+    попавшая ровно между ними, может прожить в кеше до
+    PAGE_CACHE_TIMEOUT.
+    """
+    if getattr(request, 'cache_tags', None) is not None:
+        request.cache_tags.update(versions(tags))
+
+
+def etag(request, tags):
+    """ETag страницы: поколения её тегов, адрес, пользователь и его CSRF.
+
+    Считается только по кешу, без запросов к базе. CSRF-cookie входит в
+    ETag, чтобы после повторного входа браузер не показал форму со
+    старым токеном.
+    """
+    current = versions([ALL, LEADERBOARD, *tags])
+    parts = [
+        request.get_full_path(),
+        str(request.user.pk),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        *(f'{tag}={version}' for tag, version in sorted(current.items())),
+    ]
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()
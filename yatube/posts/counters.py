@@ -0,0 +1,147 @@
+"""Денормализованные счётчики.
+
+Счётчики меняются атомарным UPDATE ... SET x = x ± 1 из сигналов, без
+чтения строки; уменьшение не опускает счётчик ниже нуля. Если они всё же
+разошлись с данными (правка базы вручную, сбой между запросами), их
+пересчитывает manage.py repair_counters.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Post, Profile
+
+
+def _shifted(field, delta):
+    # Поля счётчиков PositiveIntegerField: разошедшийся счётчик (например,
+    # после правки базы вручную) не должен уходить в минус.
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def add_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=_shifted('comment_count', delta)
+    )
+
+
+def add_posts(author_id, delta):
+    Profile.objects.filter(user_id=author_id).update(
+        post_count=_shifted('post_count', delta)
+    )
+
+
+def add_follow(user_id, author_id, delta):
+    Profile.objects.filter(user_id=author_id).update(
+        follower_count=_shifted('follower_count', delta)
+    )
+    Profile.objects.filter(user_id=user_id).update(
+        following_count=_shifted('following_count', delta)
+    )
+
+
+def _count(model, key, outer):
+    return Coalesce(Subquery(
+        model.objects.filter(**{key: OuterRef(outer)})
+        .order_by().values(key).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def recount_comments(posts):
+    """Пересчитывает comment_count постов queryset одним UPDATE.
+
+    В отличие от repair_comment_counts не сверяет и не читает строки в
+    Python: годится после массовой загрузки, когда известно, какие посты
+    затронуты.
+    """
+    return posts.update(comment_count=_count(Comment, 'post_id', 'pk'))
+
+
+def recount_profiles(profiles):
+    """Пересчитывает все счётчики профилей queryset одним UPDATE."""
+    return profiles.update(
+        post_count=_count(Post, 'author_id', 'user_id'),
+        follower_count=_count(Follow, 'author_id', 'user_id'),
+        following_count=_count(Follow, 'user_id', 'user_id'),
+    )
+
+
+def repair_comment_counts(batch_size=1000, dry_run=False):
+    """Сверяет Post.comment_count с комментариями пачками постов.
+
+    Возвращает список (post_id, было, стало) для исправленных постов.
+    """
+    fixed = []
+    last_pk = 0
+    while True:
+        posts = list(Post.objects.filter(pk__gt=last_pk).order_by('pk')
+                     .only('pk', 'comment_count')[:batch_size])
+        if not posts:
+            return fixed
+        last_pk = posts[-1].pk
+        counts = dict(
+            Comment.objects.filter(post_id__gte=posts[0].pk,
+                                   post_id__lte=last_pk)
+            .order_by().values('post_id').annotate(count=Count('pk'))
+            .values_list('post_id', 'count')
+        )
+        changed = []
+        for post in posts:
+            expected = counts.get(post.pk, 0)
+            if post.comment_count != expected:
+                fixed.append((post.pk, post.comment_count, expected))
+                post.comment_count = expected
+                changed.append(post)
+        if changed and not dry_run:
+            with transaction.atomic():
+                Post.objects.bulk_update(changed, ['comment_count'])
+
+
+def repair_profile_counts(field, model, key, batch_size=1000,
+                          dry_run=False):
+    """Сверяет счётчик Profile.<field> с числом строк model по полю key.
+
+    Возвращает список (user_id, было, стало) для исправленных профилей.
+    """
+    fixed = []
+    last_pk = 0
+    while True:
+        profiles = list(Profile.objects.filter(pk__gt=last_pk).order_by('pk')
+                        .only('pk', 'user_id', field)[:batch_size])
+        if not profiles:
+            return fixed
+        last_pk = profiles[-1].pk
+        counts = dict(
+            model.objects.filter(**{
+                f'{key}__in': [profile.user_id for profile in profiles]
+            })
+            .order_by().values(key).annotate(count=Count('pk'))
+            .values_list(key, 'count')
+        )
+        changed = []
+        for profile in profiles:
+            stored = getattr(profile, field)
+            expected = counts.get(profile.user_id, 0)
+            if stored != expected:
+                fixed.append((profile.user_id, stored, expected))
+                setattr(profile, field, expected)
+                changed.append(profile)
+        if changed and not dry_run:
+            with transaction.atomic():
+                Profile.objects.bulk_update(changed, [field])
+
+
+def repair_post_counts(batch_size=1000, dry_run=False):
+    return repair_profile_counts('post_count', Post, 'author_id',
+                                 batch_size, dry_run)
+
+
+def repair_follow_counts(batch_size=1000, dry_run=False):
+    """Возвращает исправления подписчиков и подписок двумя списками."""
+    return (
+        repair_profile_counts('follower_count', Follow, 'author_id',
+                              batch_size, dry_run),
+        repair_profile_counts('following_count', Follow, 'user_id',
+                              batch_size, dry_run),
+    )
@@ -0,0 +1,149 @@
+"""Потоковая выгрузка постов автора или группы в NDJSON и CSV.
+
+Записи читаются из базы через .iterator(chunk_size=EXPORT_CHUNK_SIZE) как
+словари values(), без объектов моделей, и сразу превращаются в строки,
+поэтому память не растёт с размером выгрузки. Формат NDJSON совпадает с
+тем, что читает manage.py import_ndjson: сначала пользователи и группа,
+затем посты, затем комментарии к ним.
+"""
+import csv
+import io
+import json
+import zlib
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Comment, Group, Post, User
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+CSV_COLUMNS = ['type', 'id', 'username', 'first_name', 'last_name',
+               'date_joined', 'slug', 'title', 'description', 'post',
+               'author', 'group', 'text', 'pub_date', 'created']
+
+# Сколько байт текста собирать перед отдачей очередного куска.
+BUFFER_SIZE = 64 * 1024
+
+
+def _date(value):
+    return value.isoformat() if value else None
+
+
+def _iterate(queryset):
+    return queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def records(posts, viewer=None):
+    """Записи выгрузки для queryset постов: авторы, посты, комментарии.
+
+    Имя, фамилия и дата регистрации выгружаются для всех пользователей,
+    только если выгрузку получает персонал (viewer — сотрудник или None,
+    как в manage.py export_posts). Иначе они есть лишь у самого viewer, а
+    у остальных авторов комментариев — одно имя пользователя.
+    """
+    full = viewer is None or viewer.is_staff
+    posts = posts.order_by('pk')
+    comments = Comment.objects.filter(post__in=posts.values('pk'))
+    authors = User.objects.filter(
+        Q(pk__in=posts.values('author_id'))
+        | Q(pk__in=comments.values('author_id'))
+    ).order_by('pk')
+    for user in _iterate(authors.values('pk', 'username', 'first_name',
+                                        'last_name', 'date_joined')):
+        if not full and user['pk'] != viewer.pk:
+            yield {'type': 'user', 'username': user['username']}
+            continue
+        yield {
+            'type': 'user',
+            'username': user['username'],
+            'first_name': user['first_name'],
+            'last_name': user['last_name'],
+            'date_joined': _date(user['date_joined']),
+        }
+    groups = Group.objects.filter(pk__in=posts.values('group_id'))
+    for group in _iterate(groups.order_by('pk').values('slug', 'title',
+                                                       'description')):
+        yield {'type': 'group', **group}
+    for post in _iterate(posts.values('pk', 'text', 'pub_date',
+                                      'author__username', 'group__slug')):
+        yield {
+            'type': 'post',
+            'id': post['pk'],
+            'author': post['author__username'],
+            'group': post['group__slug'],
+            'text': post['text'],
+            'pub_date': _date(post['pub_date']),
+        }
+    comments = comments.order_by('pk').values('pk', 'post_id', 'text',
+                                               'created', 'author__username')
+    for comment in _iterate(comments):
+        yield {
+            'type': 'comment',
+            'id': comment['pk'],
+            'post': comment['post_id'],
+            'author': comment['author__username'],
+            'text': comment['text'],
+            'created': _date(comment['created']),
+        }
+
+
+def author_records(author, viewer=None):
+    return records(Post.objects.filter(author=author), viewer)
+
+
+def group_records(group, viewer=None):
+    return records(Post.objects.filter(group=group), viewer)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render(rows, export_format):
+    """Строки выгрузки в формате 'ndjson' или 'csv'."""
+    if export_format == 'csv':
+        return csv_lines(rows)
+    return ndjson_lines(rows)
+
+
+def encode(lines, size=BUFFER_SIZE):
+    """Склеивает строки в куски байт примерно по size байт."""
+    chunk = []
+    length = 0
+    for line in lines:
+        data = line.encode()
+        chunk.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+def gzip_chunks(chunks):
+    """Сжимает поток байт в gzip по мере чтения."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,232 @@
+"""Лента подписок с раскладкой постов при публикации.
+
+Новый пост копируется в FeedItem каждого подписчика автора, и страница
+подписок читает ленту одним проходом по индексу (user, -pub_date).
+Посты авторов, у которых подписчиков больше FEED_FANOUT_MAX_FOLLOWERS,
+не раскладываются: при чтении страница ленты сливается из записей
+FeedItem и отдельного запроса по каждому такому автору. Когда автор
+перестаёт быть знаменитостью, его неразложенные посты раскладываются.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Max, OuterRef, Q, Subquery
+
+from .models import FeedItem, Follow, Post, Profile, User
+from .pagination import PREVIOUS, CursorPage, cursor_page, decode_cursor
+
+CELEBRITIES_KEY = 'feed:celebrities'
+
+# Сколько лент обрезать одним DELETE: условие растёт с каждой лентой.
+TRIM_CHUNK = 100
+
+
+def celebrity_ids():
+    """Id авторов, чьи посты читаются при запросе, а не раскладываются."""
+    celebrities = cache.get(CELEBRITIES_KEY)
+    if celebrities is None:
+        celebrities = set(
+            Profile.objects
+            .filter(follower_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+            .values_list('user_id', flat=True)
+        )
+        cache.set(CELEBRITIES_KEY, celebrities,
+                  settings.FEED_CELEBRITIES_TIMEOUT)
+    return celebrities
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков пачками.
+
+    Ленты каждой пачки сразу обрезаются до FEED_MAX_ITEMS.
+    """
+    if post.author_id in celebrity_ids():
+        return
+    last_pk = 0
+    while True:
+        follows = list(
+            Follow.objects.filter(author_id=post.author_id, pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', 'user_id')[:settings.FEED_BATCH_SIZE]
+        )
+        if not follows:
+            return
+        FeedItem.objects.bulk_create(
+            [FeedItem(user_id=user_id, post=post, pub_date=post.pub_date)
+             for _, user_id in follows],
+            ignore_conflicts=True
+        )
+        trim_many([user_id for _, user_id in follows])
+        last_pk = follows[-1][0]
+
+
+def _fan_out_sql(where):
+    """INSERT ... SELECT записей FeedItem для пар (подписка, пост) из where.
+
+    В where таблицы доступны как post и follow.
+    """
+    ops = connection.ops
+    return (
+        f'{ops.insert_statement(ignore_conflicts=True)} '
+        f'{ops.quote_name(FeedItem._meta.db_table)} '
+        '(user_id, post_id, pub_date) '
+        'SELECT follow.user_id, post.id, post.pub_date '
+        f'FROM {ops.quote_name(Post._meta.db_table)} AS post '
+        f'JOIN {ops.quote_name(Follow._meta.db_table)} AS follow '
+        'ON follow.author_id = post.author_id '
+        f'WHERE {where}'
+        f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    )
+
+
+def fan_out_since(first_pk):
+    """Раскладывает посты с pk >= first_pk по лентам всех подписчиков.
+
+    Для массовой загрузки: каждая пачка из FEED_BATCH_SIZE постов
+    раскладывается одним INSERT ... SELECT по подпискам, без чтения строк
+    в Python. Возвращает id пользователей, в ленты которых что-то попало.
+    """
+    celebrities = sorted(celebrity_ids())
+    where = 'post.id >= %s AND post.id < %s'
+    if celebrities:
+        where += ' AND post.author_id NOT IN ({})'.format(
+            ', '.join(['%s'] * len(celebrities))
+        )
+    sql = _fan_out_sql(where)
+    last_pk = Post.objects.aggregate(last=Max('pk'))['last'] or 0
+    with connection.cursor() as cursor:
+        for start in range(first_pk, last_pk + 1, settings.FEED_BATCH_SIZE):
+            cursor.execute(
+                sql, [start, start + settings.FEED_BATCH_SIZE, *celebrities]
+            )
+    return set(
+        Follow.objects.filter(
+            author__in=Post.objects.filter(pk__gte=first_pk)
+            .exclude(author__in=celebrities).values('author_id')
+        ).values_list('user_id', flat=True).distinct()
+    )
+
+
+def author_unfollowed(author_id):
+    """Раскладывает посты автора, который перестал быть знаменитостью.
+
+    Вызывается после отписки. Пока подписчиков у автора было больше
+    FEED_FANOUT_MAX_FOLLOWERS, его посты не попадали в FeedItem. Когда их
+    число опускается до порога, последние FEED_MAX_ITEMS неразложенных
+    постов раскладываются по подписчикам пачками из FEED_BATCH_SIZE
+    подписок.
+    """
+    follower_count = (Profile.objects.filter(user_id=author_id)
+                      .values_list('follower_count', flat=True).first())
+    if follower_count != settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return
+    cache.delete(CELEBRITIES_KEY)
+    posts = list(
+        Post.objects.filter(author_id=author_id, feed_items__isnull=True)
+        .order_by('-pub_date').values_list('pk', flat=True)
+        [:settings.FEED_MAX_ITEMS]
+    )
+    if not posts:
+        return
+    sql = _fan_out_sql(
+        'post.id IN ({}) AND follow.id >= %s AND follow.id <= %s'.format(
+            ', '.join(['%s'] * len(posts))
+        )
+    )
+    last_pk = 0
+    while True:
+        follows = list(
+            Follow.objects.filter(author_id=author_id, pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', 'user_id')[:settings.FEED_BATCH_SIZE]
+        )
+        if not follows:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*posts, follows[0][0], follows[-1][0]])
+        trim_many([user_id for _, user_id in follows])
+        last_pk = follows[-1][0]
+
+
+def backfill(user, author):
+    """Добавляет в ленту нового подписчика последние посты автора."""
+    if author.pk in celebrity_ids():
+        return
+    posts = (Post.objects.filter(author=author).order_by('-pub_date')
+             .values_list('pk', 'pub_date')[:settings.FEED_MAX_ITEMS])
+    FeedItem.objects.bulk_create(
+        [FeedItem(user=user, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts],
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    trim(user)
+
+
+def remove(user, author):
+    """Убирает из ленты посты автора, от которого пользователь отписался."""
+    FeedItem.objects.filter(user=user, post__author=author).delete()
+
+
+def trim(user):
+    """Оставляет в ленте пользователя не больше FEED_MAX_ITEMS записей."""
+    trim_many([user.pk])
+
+
+def trim_many(user_ids):
+    """Обрезает ленты пользователей до FEED_MAX_ITEMS записей.
+
+    Первая лишняя запись каждой ленты находится одним запросом, старые
+    записи удаляются одним DELETE на TRIM_CHUNK лент.
+    """
+    limit = settings.FEED_MAX_ITEMS
+    first_extra = (FeedItem.objects.filter(user=OuterRef('pk'))
+                   .order_by('-pub_date', '-pk')
+                   .values('pk')[limit:limit + 1])
+    cutoffs = list(
+        FeedItem.objects.filter(pk__in=Subquery(
+            User.objects.filter(pk__in=user_ids)
+            .annotate(cutoff=Subquery(first_extra))
+            .exclude(cutoff=None).values('cutoff')
+        )).values_list('user_id', 'pub_date', 'pk')
+    )
+    for start in range(0, len(cutoffs), TRIM_CHUNK):
+        stale = Q()
+        for user_id, pub_date, pk in cutoffs[start:start + TRIM_CHUNK]:
+            stale |= (Q(user_id=user_id, pub_date__lt=pub_date)
+                      | Q(user_id=user_id, pub_date=pub_date, pk__lte=pk))
+        FeedItem.objects.filter(stale).delete()
+
+
+def feed_page(user, queryset, token, per_page):
+    """Страница ленты подписок по курсору, от новых постов к старым.
+
+    Записи FeedItem пользователя и посты каждой знаменитости, на которую
+    он подписан, выбираются отдельными запросами по индексам, по
+    per_page + 1 штук, и сливаются. Сигнатура как у cursor_page, кроме
+    первого аргумента: queryset задаёт поля и связанные объекты постов.
+    """
+    celebrities = (Follow.objects
+                   .filter(user=user, author__in=celebrity_ids())
+                   .values_list('author_id', flat=True))
+    pages = [cursor_page(queryset.filter(feed_items__user=user), token,
+                         per_page)]
+    pages += [cursor_page(queryset.filter(author_id=author_id), token,
+                          per_page)
+              for author_id in celebrities]
+    if len(pages) == 1:
+        return pages[0]
+    # Посты, разложенные до того, как автор стал знаменитостью, приходят
+    # из обоих запросов.
+    merged = sorted(
+        {post.pk: post for page in pages for post in page}.values(),
+        key=lambda post: (post.pub_date, post.pk), reverse=True
+    )
+    cursor = decode_cursor(token) if token else None
+    if cursor is not None and cursor[0] == PREVIOUS:
+        has_previous = (len(merged) > per_page
+                        or any(page.has_previous() for page in pages))
+        return CursorPage(merged[-per_page:], True, has_previous)
+    has_next = (len(merged) > per_page
+                or any(page.has_next() for page in pages))
+    return CursorPage(merged[:per_page], has_next, cursor is not None)
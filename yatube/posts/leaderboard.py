@@ -0,0 +1,99 @@
+"""Таблица лидеров по рейтингу.
+
+В кеше хранится отсортированный список (rating, user_id, username) с
+запасом сверх LEADERBOARD_SIZE. Каждое изменение рейтинга правит список
+на месте; если после правок в нём осталось меньше LEADERBOARD_SIZE
+записей, он перестраивается из базы по индексу Profile.rating.
+
+Чтение, правка и запись списка идут под блокировкой cache.add: если
+блокировку держит другой процесс, список не правится, а удаляется и
+перестраивается при следующем чтении, чтобы одна из правок не потерялась.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from . import caching
+from .models import Profile
+
+LEADERBOARD_KEY = 'leaderboard'
+LOCK_KEY = 'leaderboard:lock'
+# Блокировка снимается сама, если процесс умер, не сняв её.
+LOCK_TIMEOUT = 10
+
+
+def _capacity():
+    return settings.LEADERBOARD_SIZE * 2
+
+
+def rebuild():
+    capacity = _capacity()
+    rows = [
+        (-rating, user_id, username)
+        for rating, user_id, username in Profile.objects
+        .order_by('-rating', 'user_id')
+        .values_list('rating', 'user_id', 'user__username')[:capacity]
+    ]
+    board = {'rows': rows, 'complete': len(rows) < capacity}
+    # Под чужой блокировкой список мог устареть ещё до записи: тогда он
+    # только возвращается.
+    if cache.add(LOCK_KEY, True, LOCK_TIMEOUT):
+        try:
+            cache.set(LEADERBOARD_KEY, board, settings.LEADERBOARD_TIMEOUT)
+        finally:
+            cache.delete(LOCK_KEY)
+    return board
+
+
+def top(size=None):
+    """Возвращает первых size авторов: [{'username': ..., 'rating': ...}]."""
+    board = cache.get(LEADERBOARD_KEY)
+    if board is None:
+        board = rebuild()
+    return [
+        {'user_id': user_id, 'username': username, 'rating': -rating}
+        for rating, user_id, username
+        in board['rows'][:size or settings.LEADERBOARD_SIZE]
+    ]
+
+
+def update(author_id):
+    """Переносит новый рейтинг автора в таблицу лидеров."""
+    if not cache.add(LOCK_KEY, True, LOCK_TIMEOUT):
+        # Список правит другой процесс: его правка могла бы затереть эту.
+        cache.delete(LEADERBOARD_KEY)
+        caching.bump([caching.LEADERBOARD])
+        return
+    try:
+        _update(author_id)
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def _update(author_id):
+    board = cache.get(LEADERBOARD_KEY)
+    if board is None:
+        # Без таблицы не узнать, попал ли автор в шапку; считаем, что попал.
+        caching.bump([caching.LEADERBOARD])
+        return
+    profile = (Profile.objects.filter(user_id=author_id)
+               .values_list('rating', 'user__username').first())
+    if profile is None:
+        return
+    rating, username = profile
+    row = (-rating, author_id, username)
+    rows = [item for item in board['rows'] if item[1] != author_id]
+    if board['complete'] or (rows and row < rows[-1]):
+        rows.append(row)
+        rows.sort()
+    if len(rows) > _capacity():
+        del rows[_capacity():]
+        board['complete'] = False
+    widget_size = settings.LEADERBOARD_WIDGET_SIZE
+    if rows[:widget_size] != board['rows'][:widget_size]:
+        # Изменилась шапка сайта, закешированные страницы устарели.
+        caching.bump([caching.LEADERBOARD])
+    if not board['complete'] and len(rows) < settings.LEADERBOARD_SIZE:
+        cache.delete(LEADERBOARD_KEY)
+        return
+    board['rows'] = rows
+    cache.set(LEADERBOARD_KEY, board, settings.LEADERBOARD_TIMEOUT)
@@ -0,0 +1,160 @@
+import math
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import FloatField, Func, Max
+from django.utils import timezone
+
+from posts import caching
+from posts.models import Profile, User, Vote
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class Epoch(Func):
+    """Дата как число секунд с 1970 года, посчитанное в базе.
+
+    Так голоса не превращаются в объекты datetime по одному в Python.
+    """
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template="CAST(strftime('%%%%s', %(expressions)s) AS REAL)",
+            **extra_context
+        )
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection,
+                           template='EXTRACT(EPOCH FROM %(expressions)s)',
+                           **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection,
+                           template='UNIX_TIMESTAMP(%(expressions)s)',
+                           **extra_context)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг с затуханием: вес голоса падает вдвое '
+            'каждые RATING_HALF_LIFE_DAYS дней.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--half-life', type=float,
+            default=settings.RATING_HALF_LIFE_DAYS,
+            help='Период полураспада голоса в днях.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=100000,
+            help='Сколько голосов читать из базы за раз.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько профилей обновлять одним запросом.'
+        )
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError('Для пересчёта нужен пакет numpy.')
+        if options['half_life'] <= 0:
+            raise CommandError('--half-life должен быть больше нуля.')
+        scores = self.compute_scores(options['half_life'],
+                                     options['chunk_size'])
+        updated = self.write_scores(scores, options['batch_size'])
+        caching.bump([caching.ALL])
+        self.stdout.write(f'Обновлено профилей: {updated}')
+
+    def compute_scores(self, half_life, chunk_size):
+        """Возвращает массив очков, проиндексированный id пользователя.
+
+        Направление голосов, перенесённых из SetRating (Vote.LEGACY),
+        неизвестно. Им достаётся поровну та часть Profile.rating, которую
+        не объясняют голоса с направлением, и она затухает с возрастом
+        каждого такого голоса, как обычный голос.
+        """
+        max_id = User.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+        scores = np.zeros(max_id + 1)
+        # Сумма голосов с направлением без затухания, число голосов
+        # LEGACY и сумма их коэффициентов затухания по авторам.
+        known = np.zeros(max_id + 1)
+        legacy_counts = np.zeros(max_id + 1)
+        legacy_weights = np.zeros(max_id + 1)
+        now = timezone.now().timestamp()
+        rate = math.log(2) / (half_life * SECONDS_PER_DAY)
+        votes = (Vote.objects.order_by()
+                 .annotate(epoch=Epoch('created'))
+                 .values_list('author_id', 'value', 'epoch')
+                 .iterator(chunk_size=chunk_size))
+        chunk = []
+        for vote in votes:
+            chunk.append(vote)
+            if len(chunk) == chunk_size:
+                self.add_chunk(scores, known, legacy_counts, legacy_weights,
+                               chunk, now, rate)
+                chunk = []
+        if chunk:
+            self.add_chunk(scores, known, legacy_counts, legacy_weights,
+                           chunk, now, rate)
+        legacy_authors = np.flatnonzero(legacy_counts)
+        if len(legacy_authors):
+            ratings = np.zeros(max_id + 1)
+            for user_id, rating in (
+                    Profile.objects
+                    .filter(user_id__in=legacy_authors.tolist())
+                    .values_list('user_id', 'rating')):
+                ratings[user_id] = rating
+            per_vote = np.clip(
+                (ratings[legacy_authors] - known[legacy_authors])
+                / legacy_counts[legacy_authors],
+                -settings.RATING_DELTA, settings.RATING_DELTA
+            )
+            scores[legacy_authors] += per_vote * legacy_weights[legacy_authors]
+        return scores
+
+    @staticmethod
+    def add_chunk(scores, known, legacy_counts, legacy_weights, chunk, now,
+                  rate):
+        size = len(scores)
+        author_ids, values, timestamps = (np.array(column)
+                                          for column in zip(*chunk))
+        values = values.astype(float) * settings.RATING_DELTA
+        decay = np.exp(-rate * np.maximum(now - timestamps, 0))
+        scores += np.bincount(author_ids, weights=values * decay,
+                              minlength=size)[:size]
+        known += np.bincount(author_ids, weights=values,
+                             minlength=size)[:size]
+        legacy = values == 0
+        legacy_counts += np.bincount(author_ids[legacy],
+                                     minlength=size)[:size]
+        legacy_weights += np.bincount(author_ids[legacy],
+                                      weights=decay[legacy],
+                                      minlength=size)[:size]
+
+    @staticmethod
+    def write_scores(scores, batch_size):
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                Profile.objects.filter(pk__gt=last_pk).order_by('pk')
+                .only('pk', 'user_id')[:batch_size]
+            )
+            if not batch:
+                return updated
+            for profile in batch:
+                if profile.user_id < len(scores):
+                    profile.decayed_rating = float(scores[profile.user_id])
+                else:
+                    profile.decayed_rating = 0
+            with transaction.atomic():
+                Profile.objects.bulk_update(batch, ['decayed_rating'])
+            updated += len(batch)
+            last_pk = batch[-1].pk
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = ('Уменьшает очки популярности постов: они падают вдвое каждые '
+            'TRENDING_HALF_LIFE_HOURS часов. Запускается по расписанию.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float, default=1,
+            help='Сколько часов прошло с прошлого запуска.'
+        )
+
+    def handle(self, *args, **options):
+        if options['hours'] <= 0:
+            raise CommandError('--hours должен быть больше нуля.')
+        if settings.TRENDING_HALF_LIFE_HOURS <= 0:
+            raise CommandError('TRENDING_HALF_LIFE_HOURS должен быть '
+                               'больше нуля.')
+        updated = trending.decay(options['hours'])
+        self.stdout.write(f'Обновлено постов: {updated}')
@@ -0,0 +1,57 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+from posts.models import Group, User
+
+
+class Command(BaseCommand):
+    help = ('Выгружает посты автора или группы вместе с комментариями в '
+            'NDJSON или CSV, не загружая их в память целиком. NDJSON '
+            'можно загрузить обратно через import_ndjson.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--author', help='Имя пользователя-автора.')
+        parser.add_argument('--group', help='Slug группы.')
+        parser.add_argument(
+            '--format', choices=list(export.FORMATS), default='ndjson',
+            help='Формат выгрузки.'
+        )
+        parser.add_argument(
+            '--output', default='-',
+            help='Файл для выгрузки; без аргумента — стандартный вывод.'
+        )
+        parser.add_argument(
+            '--gzip', action='store_true',
+            help='Сжимать выгрузку gzip на лету.'
+        )
+
+    def handle(self, *args, **options):
+        # call_command в Django 2.2 не передаёт парсеру аргументы из
+        # обязательной группы, поэтому выбор источника проверяется здесь.
+        if bool(options['author']) == bool(options['group']):
+            raise CommandError('Укажите ровно одно из --author и --group.')
+        if options['author']:
+            author = User.objects.filter(username=options['author']).first()
+            if author is None:
+                raise CommandError('Пользователь не найден.')
+            rows = export.author_records(author)
+        else:
+            group = Group.objects.filter(slug=options['group']).first()
+            if group is None:
+                raise CommandError('Группа не найдена.')
+            rows = export.group_records(group)
+        chunks = export.encode(export.render(rows, options['format']))
+        if options['gzip']:
+            chunks = export.gzip_chunks(chunks)
+        if options['output'] == '-':
+            output = sys.stdout.buffer
+        else:
+            output = open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import ratings
+
+
+class Command(BaseCommand):
+    help = 'Переносит голоса из журнала отложенной записи в базу.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Сбрасывать журнал каждые RATING_FLUSH_INTERVAL секунд.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            applied = ratings.flush()
+            if applied or options['verbosity'] > 1:
+                self.stdout.write(f'Учтено голосов: {applied}')
+            if not options['loop']:
+                return
+            time.sleep(settings.RATING_FLUSH_INTERVAL)
@@ -0,0 +1,125 @@
+import io
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import cycle, islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from PIL import Image
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def generate(post_id):
+    # Вызывается в потоке пула: соединение потока закрывается после работы.
+    try:
+        return thumbnails.generate(post_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Строит миниатюры картинок постов, которых ещё нет (например, '
+            'после перезапуска процесса, не успевшего их построить).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int,
+            default=max(settings.POST_THUMBNAIL_WORKERS, 1),
+            help='Сколько миниатюр строить параллельно.'
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Не завершаться, а проверять новые посты каждые '
+                 'POST_THUMBNAIL_INTERVAL секунд.'
+        )
+        parser.add_argument(
+            '--benchmark', type=int, metavar='N',
+            help='Ничего не сохранять, а замерить, сколько картинок в '
+                 'секунду обрабатывается (из N картинок постов), и средний '
+                 'размер каждой миниатюры.'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers должно быть больше нуля.')
+        if options['benchmark']:
+            return self.benchmark(options['benchmark'], options['workers'])
+        # Посты с нечитаемой картинкой пропускаются до перезапуска
+        # команды, чтобы --loop не спотыкался о них каждый проход.
+        self.broken = set()
+        # С одним потоком миниатюры строятся прямо здесь, в соединении
+        # команды, без пула.
+        pool = None
+        if options['workers'] > 1:
+            pool = ThreadPoolExecutor(max_workers=options['workers'])
+            run = partial(pool.map, partial(self.build, generate))
+        else:
+            run = partial(map, partial(self.build, thumbnails.generate))
+        try:
+            while True:
+                ids = [pk for pk in thumbnails.missing().order_by('pk')
+                       .values_list('pk', flat=True)
+                       if pk not in self.broken]
+                started = time.monotonic()
+                built = sum(len(created) for created in run(ids))
+                if built or options['verbosity'] > 1:
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f'Построено миниатюр: {built} за {elapsed:.1f} с'
+                    )
+                if not options['loop']:
+                    return
+                time.sleep(settings.POST_THUMBNAIL_INTERVAL)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def build(self, generate_one, post_id):
+        try:
+            return generate_one(post_id)
+        except thumbnails.BrokenImage as exc:
+            self.stderr.write(f'Картинка не читается, пропущена: {exc}')
+            self.broken.add(post_id)
+            return []
+
+    def benchmark(self, count, workers):
+        sources = []
+        for post in Post.objects.exclude(image='').only('image')[:count]:
+            with post.image.open('rb') as source:
+                sources.append(source.read())
+        if not sources:
+            # Постов с картинками нет: берётся фотография типичного размера.
+            size = (3000, 2000)
+            gradient = Image.linear_gradient('L').resize(size)
+            noise = Image.effect_noise(size, 40)
+            output = io.BytesIO()
+            Image.merge('RGB', (gradient, noise, gradient.rotate(180))).save(
+                output, 'JPEG', quality=90
+            )
+            sources.append(output.getvalue())
+        images = list(islice(cycle(sources), count))
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            rendered = list(pool.map(
+                lambda data: thumbnails.render(io.BytesIO(data)), images
+            ))
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Картинок: {count}, потоков: {workers}, '
+            f'{count / elapsed:.1f} картинок и '
+            f'{count * len(rendered[0]) / elapsed:.1f} миниатюр в секунду'
+        )
+        sizes = defaultdict(list)
+        for variants in rendered:
+            for width, height, image_format, content in variants:
+                sizes[image_format, width, height].append(len(content))
+        for (image_format, width, height), lengths in sorted(sizes.items()):
+            self.stdout.write(
+                f'{image_format} {width}x{height}: '
+                f'{sum(lengths) / len(lengths) / 1024:.1f} КБ в среднем'
+            )
@@ -0,0 +1,276 @@
+import json
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import caching, counters, feed, leaderboard, search, trending
+from posts.models import Comment, Follow, Group, Post, Profile, User
+from posts.pagination import COUNT_KEY
+
+# Сколько профилей пересчитывать одним UPDATE ... WHERE user_id IN (...).
+PROFILE_BATCH = 500
+
+
+class Table:
+    """Готовый INSERT для модели и сборка строк для него.
+
+    Строки собираются кортежами без создания объектов модели: на
+    миллионах записей конструктор модели и подготовка значений в
+    bulk_create занимают больше времени, чем сама вставка.
+    """
+
+    def __init__(self, model, explicit_pk=True, ignore_conflicts=False):
+        fields = [field for field in model._meta.concrete_fields
+                  if explicit_pk or not field.primary_key]
+        self.columns = [field.attname for field in fields]
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.defaults = [field.get_default() for field in fields]
+        self.dates = {field.attname for field in fields
+                      if isinstance(field, models.DateTimeField)}
+        ops = connection.ops
+        self.sql = '{} {} ({}) VALUES ({}){}'.format(
+            ops.insert_statement(ignore_conflicts=ignore_conflicts),
+            ops.quote_name(model._meta.db_table),
+            ', '.join(ops.quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+            ops.ignore_conflicts_suffix_sql(ignore_conflicts=ignore_conflicts),
+        )
+        self.rows = []
+        self.loaded = 0
+
+    def add(self, **values):
+        row = self.defaults.copy()
+        for name, value in values.items():
+            if name in self.dates:
+                value = connection.ops.adapt_datetimefield_value(value)
+            row[self.index[name]] = value
+        self.rows.append(row)
+
+    def flush(self, cursor, batch_size):
+        for start in range(0, len(self.rows), batch_size):
+            cursor.executemany(self.sql, self.rows[start:start + batch_size])
+        self.loaded += len(self.rows)
+        self.rows = []
+
+
+class Command(BaseCommand):
+    help = ('Загружает пользователей, группы, посты, комментарии и подписки '
+            'из NDJSON (одна JSON-запись в строке) пачками INSERT. Каждая '
+            'запись содержит поле type: user, group, post, comment или '
+            'follow.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл NDJSON; без аргумента или "-" — стандартный ввод.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Сколько строк передавать в базу одним executemany.'
+        )
+        parser.add_argument(
+            '--transaction-size', type=int, default=50000,
+            help='Сколько записей сохранять в одной транзакции.'
+        )
+        parser.add_argument(
+            '--skip-feeds', action='store_true',
+            help='Не заполнять ленты для загруженных подписок.'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['transaction_size'] < 1:
+            raise CommandError('Размеры пачек должны быть больше нуля.')
+        self.options = options
+        # Порядок таблиц — порядок вставки: сначала то, на что ссылаются.
+        self.tables = {
+            User: Table(User),
+            Profile: Table(Profile, explicit_pk=False),
+            Group: Table(Group),
+            Post: Table(Post),
+            Comment: Table(Comment),
+            Follow: Table(Follow, explicit_pk=False, ignore_conflicts=True),
+        }
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        # id поста в источнике -> id в базе.
+        self.posts = {}
+        # id назначаются заранее: по ним комментарии находят свои посты.
+        self.next_pk = {
+            model: (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+            for model in (User, Group, Post, Comment)
+        }
+        self.first_post_pk = self.next_pk[Post]
+        self.follows = []
+        # Пользователи, у которых могли измениться счётчики профиля.
+        self.counted = set()
+        self.touched = {'index'}
+        self.skipped = 0
+        started = time.monotonic()
+        stream = (sys.stdin if options['path'] == '-'
+                  else open(options['path'], encoding='utf-8'))
+        try:
+            with search.bulk_load():
+                self.load(stream)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.finish()
+        elapsed = time.monotonic() - started
+        total = sum(table.loaded for table in self.tables.values())
+        for model, table in self.tables.items():
+            self.stdout.write(f'{model._meta.verbose_name_plural}: '
+                              f'{table.loaded}')
+        self.stdout.write(
+            f'Загружено записей: {total}, пропущено: {self.skipped}, '
+            f'{total / elapsed if elapsed else total:.0f} в секунду'
+        )
+
+    def load(self, stream):
+        parsers = {
+            'user': self.parse_user,
+            'group': self.parse_group,
+            'post': self.parse_post,
+            'comment': self.parse_comment,
+            'follow': self.parse_follow,
+        }
+        in_transaction = 0
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                parsers[record['type']](record)
+            except (ValueError, KeyError, TypeError) as exc:
+                self.skipped += 1
+                self.stderr.write(f'Строка {number} пропущена: {exc!r}')
+                continue
+            in_transaction += 1
+            if in_transaction >= self.options['transaction_size']:
+                self.flush()
+                in_transaction = 0
+        self.flush()
+
+    def flush(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            for table in self.tables.values():
+                table.flush(cursor, self.options['batch_size'])
+
+    def take_pk(self, model):
+        pk = self.next_pk[model]
+        self.next_pk[model] += 1
+        return pk
+
+    @staticmethod
+    def parse_date(value):
+        if not value:
+            return timezone.now()
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f'неверная дата {value!r}')
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def parse_user(self, record):
+        username = record['username']
+        if username in self.users:
+            return
+        pk = self.take_pk(User)
+        self.tables[User].add(
+            id=pk, username=username,
+            first_name=record.get('first_name', ''),
+            last_name=record.get('last_name', ''),
+            password=make_password(None),
+            date_joined=self.parse_date(record.get('date_joined')),
+        )
+        self.tables[Profile].add(user_id=pk)
+        self.users[username] = pk
+
+    def parse_group(self, record):
+        slug = record['slug']
+        if slug in self.groups:
+            return
+        pk = self.take_pk(Group)
+        self.tables[Group].add(
+            id=pk, slug=slug, title=record.get('title', slug),
+            description=record.get('description', ''),
+        )
+        self.groups[slug] = pk
+
+    def parse_post(self, record):
+        author_id = self.users[record['author']]
+        group_id = None
+        if record.get('group'):
+            group_id = self.groups[record['group']]
+        pub_date = self.parse_date(record.get('pub_date'))
+        pk = self.take_pk(Post)
+        self.tables[Post].add(id=pk, text=record['text'], author_id=author_id,
+                              group_id=group_id, pub_date=pub_date)
+        if record.get('id') is not None:
+            self.posts[record['id']] = pk
+        self.counted.add(author_id)
+        if group_id:
+            self.touched.add(f'group:{group_id}')
+
+    def parse_comment(self, record):
+        post_id = self.posts[record['post']]
+        author_id = self.users[record['author']]
+        created = self.parse_date(record.get('created'))
+        self.tables[Comment].add(id=self.take_pk(Comment),
+                                 text=record['text'], post_id=post_id,
+                                 author_id=author_id, created=created)
+
+    def parse_follow(self, record):
+        user_id = self.users[record['user']]
+        author_id = self.users[record['author']]
+        if user_id == author_id:
+            raise ValueError('подписка на самого себя')
+        self.tables[Follow].add(user_id=user_id, author_id=author_id)
+        self.follows.append((user_id, author_id))
+        self.counted.update((user_id, author_id))
+
+    def fill_feeds(self):
+        """Ленты: загруженные посты всем подписчикам, включая тех, кто был
+        подписан до загрузки, и прежние посты — новым подписчикам."""
+        users = feed.fan_out_since(self.first_post_pk)
+        authors_with_old_posts = set(
+            Post.objects.filter(
+                pk__lt=self.first_post_pk,
+                author_id__in={author_id for _, author_id in self.follows}
+            ).values_list('author_id', flat=True).distinct()
+        )
+        for user_id, author_id in self.follows:
+            if author_id in authors_with_old_posts:
+                feed.backfill(User(pk=user_id), User(pk=author_id))
+                users.discard(user_id)
+        users = sorted(users)
+        for start in range(0, len(users), settings.FEED_BATCH_SIZE):
+            feed.trim_many(users[start:start + settings.FEED_BATCH_SIZE])
+
+    def finish(self):
+        """Приводит в порядок всё, что обычно делают сигналы save()."""
+        # Комментарии загружаются только к загруженным постам.
+        counters.recount_comments(
+            Post.objects.filter(pk__gte=self.first_post_pk)
+        )
+        counted = sorted(self.counted)
+        for start in range(0, len(counted), PROFILE_BATCH):
+            counters.recount_profiles(Profile.objects.filter(
+                user_id__in=counted[start:start + PROFILE_BATCH]
+            ))
+        imported = Post.objects.filter(pk__gte=self.first_post_pk)
+        trending.seed_many(imported)
+        cache.delete(feed.CELEBRITIES_KEY)
+        if not self.options['skip_feeds']:
+            self.fill_feeds()
+        cache.delete_many([COUNT_KEY.format(name) for name in self.touched])
+        leaderboard.rebuild()
+        caching.bump([caching.ALL, caching.LEADERBOARD])
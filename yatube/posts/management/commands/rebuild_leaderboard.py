@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts import caching, leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает таблицу лидеров по рейтингу из базы.'
+
+    def handle(self, *args, **options):
+        board = leaderboard.rebuild()
+        caching.bump([caching.LEADERBOARD])
+        self.stdout.write(f'В таблице лидеров: {len(board["rows"])}')
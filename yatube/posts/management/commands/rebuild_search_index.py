@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = ('Заново строит полнотекстовый индекс постов и комментариев '
+            'из таблиц posts_post и posts_comment.')
+
+    def handle(self, *args, **options):
+        if not search.available():
+            raise CommandError('Полнотекстовый индекс есть только в SQLite.')
+        search.rebuild()
+        self.stdout.write('Поисковый индекс перестроен')
@@ -0,0 +1,163 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from posts import caching, leaderboard
+from posts.models import Profile, Rating, Vote
+
+
+class Command(BaseCommand):
+    help = ('Сверяет рейтинг авторов с голосами и исправляет расхождения. '
+            'Голоса читаются потоком, память не зависит от размера таблиц.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Сколько голосов читать из базы за раз.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько авторов сверять и исправлять в одной транзакции.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения.'
+        )
+        parser.add_argument(
+            '--include-legacy', action='store_true',
+            help=('Исправлять и авторов с перенесёнными из SetRating '
+                  'голосами без направления (они считаются нулевыми).')
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR,
+                                 'reconcile_ratings.checkpoint'),
+            help='Файл, в котором запоминается последний сверенный автор.'
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Продолжить с автора, сохранённого в --checkpoint.'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        start = self.read_checkpoint() if options['resume'] else 0
+        votes = self.stream_votes(start)
+        vote = next(votes, None)
+        checked = fixed = 0
+        while True:
+            profiles = list(
+                Profile.objects.filter(user_id__gt=start).order_by('user_id')
+                .only('pk', 'user_id', 'rating')[:options['batch_size']]
+            )
+            if not profiles:
+                break
+            last = profiles[-1].user_id
+            totals = {}
+            legacy = set()
+            while vote is not None and vote[0] <= last:
+                author_id, value = vote
+                totals[author_id] = (totals.get(author_id, 0)
+                                     + value * settings.RATING_DELTA)
+                if value == Vote.LEGACY:
+                    legacy.add(author_id)
+                vote = next(votes, None)
+            fixed += self.reconcile(profiles, totals, legacy)
+            checked += len(profiles)
+            start = last
+            if not options['dry_run']:
+                self.write_checkpoint(start)
+        if fixed and not options['dry_run']:
+            leaderboard.rebuild()
+            caching.bump([caching.ALL])
+        if not options['dry_run'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        self.stdout.write(f'Проверено авторов: {checked}, '
+                          f'расхождений: {fixed}')
+
+    def stream_votes(self, start):
+        return (Vote.objects.filter(author_id__gt=start)
+                .order_by('author_id')
+                .values_list('author_id', 'value')
+                .iterator(chunk_size=self.options['chunk_size']))
+
+    @transaction.atomic
+    def reconcile(self, profiles, totals, legacy):
+        author_ids = [profile.user_id for profile in profiles]
+        ratings = {
+            rating.author_id: rating
+            for rating in Rating.objects.filter(author_id__in=author_ids)
+        }
+        fixed = 0
+        for profile in profiles:
+            author_id = profile.user_id
+            expected = totals.get(author_id, 0)
+            rating = ratings.get(author_id)
+            stored = rating.rat if rating is not None else 0
+            if profile.rating == expected and stored == expected:
+                continue
+            skip = author_id in legacy and not self.options['include_legacy']
+            self.stdout.write(
+                f'Автор {author_id}: рейтинг {stored}, в профиле '
+                f'{profile.rating}, по голосам {expected}'
+                + (' (пропущен: есть голоса без направления)' if skip else '')
+            )
+            if skip:
+                continue
+            if self.options['dry_run']:
+                fixed += 1
+                continue
+            written, raced = self.write(profile, rating, expected)
+            if raced:
+                self.stdout.write(
+                    f'Автор {author_id}: рейтинг изменился во время сверки, '
+                    'он будет сверен при следующем запуске'
+                )
+            fixed += written
+        return fixed
+
+    def write(self, profile, rating, expected):
+        """Сдвигает счётчики на разницу с прочитанным значением.
+
+        Голос, записанный после чтения, меняет счётчик через F(), и
+        абсолютное значение его бы затёрло. Поэтому UPDATE срабатывает,
+        только если счётчик всё ещё равен прочитанному; иначе строка
+        остаётся до следующего запуска. Возвращает (исправлено ли что-то,
+        помешал ли параллельный голос).
+        """
+        written = raced = False
+        if profile.rating != expected:
+            updated = Profile.objects.filter(
+                pk=profile.pk, rating=profile.rating
+            ).update(rating=F('rating') + (expected - profile.rating))
+            written |= bool(updated)
+            raced |= not updated
+        if rating is None:
+            _, created = Rating.objects.get_or_create(
+                author_id=profile.user_id, defaults={'rat': expected}
+            )
+            written |= created
+            raced |= not created
+        elif rating.rat != expected:
+            updated = Rating.objects.filter(
+                pk=rating.pk, rat=rating.rat
+            ).update(rat=F('rat') + (expected - rating.rat))
+            written |= bool(updated)
+            raced |= not updated
+        return written, raced
+
+    def read_checkpoint(self):
+        try:
+            with open(self.options['checkpoint']) as checkpoint:
+                return int(checkpoint.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def write_checkpoint(self, author_id):
+        path = self.options['checkpoint']
+        with open(path + '.tmp', 'w') as checkpoint:
+            checkpoint.write(str(author_id))
+        os.replace(path + '.tmp', path)
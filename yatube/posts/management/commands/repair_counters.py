@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from posts import caching, counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики и исправляет ошибки.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк сверять за один запрос.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения.'
+        )
+
+    def handle(self, *args, **options):
+        size, dry_run = options['batch_size'], options['dry_run']
+        followers, following = counters.repair_follow_counts(size, dry_run)
+        reports = [
+            ('Пост {}: комментариев {}, на самом деле {}',
+             counters.repair_comment_counts(size, dry_run)),
+            ('Автор {}: постов {}, на самом деле {}',
+             counters.repair_post_counts(size, dry_run)),
+            ('Автор {}: подписчиков {}, на самом деле {}', followers),
+            ('Пользователь {}: подписок {}, на самом деле {}', following),
+        ]
+        fixed = 0
+        for message, rows in reports:
+            for row in rows:
+                self.stdout.write(message.format(*row))
+            fixed += len(rows)
+        if fixed and not dry_run:
+            caching.bump([caching.ALL])
+        self.stdout.write(f'Исправлено счётчиков: {fixed}')
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import feed
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Обрезает ленты подписок до FEED_MAX_ITEMS записей.'
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(feed_items__isnull=False)
+                     .distinct().order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(users), settings.FEED_BATCH_SIZE):
+            feed.trim_many(users[start:start + settings.FEED_BATCH_SIZE])
+        self.stdout.write(f'Проверено лент: {len(users)}')
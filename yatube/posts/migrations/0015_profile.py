@@ -0,0 +1,60 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:15
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def fill_profiles(apps, schema_editor):
+    """Сводит дубли Rating в одну строку и переносит сумму в Profile."""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Profile = apps.get_model('posts', 'Profile')
+    Rating = apps.get_model('posts', 'Rating')
+    totals = dict(
+        Rating.objects.values('author').annotate(total=Sum('rat'))
+        .values_list('author', 'total')
+    )
+    for author_id, total in totals.items():
+        ratings = Rating.objects.filter(author_id=author_id).order_by('pk')
+        first = ratings.first()
+        ratings.exclude(pk=first.pk).delete()
+        if first.rat != total:
+            first.rat = total
+            first.save(update_fields=['rat'])
+    Profile.objects.bulk_create(
+        Profile(user_id=user_id, rating=totals.get(user_id) or 0)
+        for user_id in User.objects.values_list('pk', flat=True).iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0014_auto_20220206_1411'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.IntegerField(default=0, verbose_name='Рейтинг')),
+            ],
+            options={
+                'verbose_name': 'Профиль',
+                'verbose_name_plural': 'Профили',
+            },
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.RunPython(fill_profiles, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rating',
+            constraint=models.UniqueConstraint(fields=('author',), name='unique_rating'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def copy_set_ratings(apps, schema_editor):
+    """Переносит SetRating в Vote.
+
+    SetRating не хранил направление голоса, поэтому перенесённые голоса
+    получают значение 0 (Vote.LEGACY). Строки с неизвестными именами
+    пользователей (например, AnonymousUser) пропускаются.
+    """
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    SetRating = apps.get_model('posts', 'SetRating')
+    Vote = apps.get_model('posts', 'Vote')
+    user_ids = dict(User.objects.values_list('username', 'pk'))
+    pairs = set()
+    for user, author in SetRating.objects.values_list('user', 'author'):
+        if user in user_ids and author in user_ids and user != author:
+            pairs.add((user_ids[user], user_ids[author]))
+    Vote.objects.bulk_create(
+        (Vote(user_id=user_id, author_id=author_id, value=0)
+         for user_id, author_id in pairs),
+        batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0015_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vote',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.SmallIntegerField(choices=[(1, 'За'), (-1, 'Против'), (0, 'Неизвестно')], verbose_name='Голос')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата голоса')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_votes', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Голос',
+                'verbose_name_plural': 'Голоса',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_vote'),
+        ),
+        migrations.RunPython(copy_set_ratings, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='SetRating',
+        ),
+    ]
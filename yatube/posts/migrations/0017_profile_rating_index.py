@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_vote'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='rating',
+            field=models.IntegerField(db_index=True, default=0, verbose_name='Рейтинг'),
+        ),
+    ]
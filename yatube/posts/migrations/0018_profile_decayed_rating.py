@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_profile_rating_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='decayed_rating',
+            field=models.FloatField(default=0, verbose_name='Рейтинг с затуханием'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    """Раскладывает в ленты уже существующих подписок последние посты."""
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    FeedItem = apps.get_model('posts', 'FeedItem')
+    celebrities = set(
+        Follow.objects.values('author').annotate(followers=Count('id'))
+        .filter(followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+        .values_list('author', flat=True)
+    )
+    follows = (Follow.objects.exclude(author__in=celebrities)
+               .values_list('user_id', 'author_id').iterator())
+    for user_id, author_id in follows:
+        posts = (Post.objects.filter(author_id=author_id)
+                 .order_by('-pub_date')
+                 .values_list('pk', 'pub_date')[:settings.FEED_MAX_ITEMS])
+        FeedItem.objects.bulk_create(
+            [FeedItem(user_id=user_id, post_id=post_id, pub_date=pub_date)
+             for post_id, pub_date in posts],
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0018_profile_decayed_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='posts.Post', verbose_name='Пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+                'ordering': ('-pub_date',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-pub_date'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_feed_item'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, help_text='Растёт с каждым комментарием и затухает со временем (manage.py decay_trending)', verbose_name='Популярность'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-trending_score', '-id'], name='post_trending_idx'),
+        ),
+    ]
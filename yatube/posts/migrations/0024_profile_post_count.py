@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_post_counts(apps, schema_editor):
+    Profile = apps.get_model('posts', 'Profile')
+    Post = apps.get_model('posts', 'Post')
+    counts = (Post.objects.filter(author=OuterRef('user')).order_by()
+              .values('author').annotate(count=Count('pk')).values('count'))
+    Profile.objects.update(post_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Число постов'),
+        ),
+        migrations.RunPython(fill_post_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_follow_counts(apps, schema_editor):
+    Profile = apps.get_model('posts', 'Profile')
+    Follow = apps.get_model('posts', 'Follow')
+    followers = (Follow.objects.filter(author=OuterRef('user')).order_by()
+                 .values('author').annotate(count=Count('pk'))
+                 .values('count'))
+    following = (Follow.objects.filter(user=OuterRef('user')).order_by()
+                 .values('user').annotate(count=Count('pk'))
+                 .values('count'))
+    Profile.objects.update(
+        follower_count=Coalesce(Subquery(followers), 0),
+        following_count=Coalesce(Subquery(following), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_profile_post_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='follower_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Число подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Число подписок'),
+        ),
+        migrations.RunPython(fill_follow_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_comment_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Thumbnail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Имя файла картинки поста, из которой сделана миниатюра', max_length=255, verbose_name='Исходная картинка')),
+                ('image', models.ImageField(height_field='height', upload_to='thumbnails/', verbose_name='Миниатюра', width_field='width')),
+                ('width', models.PositiveIntegerField(verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(verbose_name='Высота')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thumbnails', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Миниатюра',
+                'verbose_name_plural': 'Миниатюры',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='thumbnail',
+            constraint=models.UniqueConstraint(fields=('post', 'source'), name='unique_thumbnail'),
+        ),
+    ]
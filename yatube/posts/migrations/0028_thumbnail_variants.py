@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0027_post_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='thumbnail',
+            name='unique_thumbnail',
+        ),
+        migrations.AddField(
+            model_name='thumbnail',
+            name='format',
+            field=models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG'), ('png', 'PNG')], default='jpeg', max_length=4, verbose_name='Формат'),
+        ),
+        migrations.AddConstraint(
+            model_name='thumbnail',
+            constraint=models.UniqueConstraint(fields=('post', 'source', 'width', 'format'), name='unique_thumbnail_variant'),
+        ),
+    ]
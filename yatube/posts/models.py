@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 
@@ -13,6 +14,16 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_list(self):
+        """Посты вместе со всем, что выводится в карточке поста."""
+        return self.select_related('author__profile', 'group')
+
+    def for_page(self):
+        """Посты для карточек на странице: for_list и готовые миниатюры."""
+        return self.for_list().prefetch_related('thumbnails')
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста',
@@ -42,15 +53,74 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    trending_score = models.FloatField(
+        'Популярность',
+        default=0,
+        editable=False,
+        help_text=('Растёт с каждым комментарием и затухает со временем '
+                   '(manage.py decay_trending)')
+    )
+    comment_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_id_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['-trending_score', '-id'],
+                         name='post_trending_idx'),
+        ]
 
     def __str__(self):
         return self.text
 
+    def ready_thumbnails(self):
+        """Готовые миниатюры текущей картинки, от узких к широким."""
+        return sorted(
+            (thumbnail for thumbnail in self.thumbnails.all()
+             if thumbnail.source == self.image.name),
+            key=lambda thumbnail: thumbnail.width
+        )
+
+    @property
+    def thumbnail(self):
+        """Самая широкая готовая миниатюра в формате для всех браузеров.
+
+        Пока её нет, шаблон показывает исходную картинку.
+        """
+        fallback = [thumbnail for thumbnail in self.ready_thumbnails()
+                    if thumbnail.format != Thumbnail.WEBP]
+        return fallback[-1] if fallback else None
+
+    @property
+    def thumbnail_sources(self):
+        """Наборы srcset для <picture> по форматам, WebP первым."""
+        srcsets = {}
+        for thumbnail in self.ready_thumbnails():
+            srcsets.setdefault(thumbnail.format, []).append(
+                f'{thumbnail.image.url} {thumbnail.width}w'
+            )
+        return [
+            {'type': Thumbnail.MIME_TYPES[image_format],
+             'srcset': ', '.join(srcset)}
+            for image_format, srcset in sorted(
+                srcsets.items(),
+                key=lambda item: item[0] != Thumbnail.WEBP
+            )
+        ]
+
 
 class Comment(models.Model):
     text = models.TextField(
@@ -78,6 +148,10 @@ class Comment(models.Model):
         ordering = ('-created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.text
@@ -107,6 +181,96 @@ class Follow(models.Model):
         ]
 
 
+class FeedItem(models.Model):
+    """Пост в ленте подписчика, разложенный туда при публикации."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed_items'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='feed_items'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_feed_item'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date'],
+                         name='feed_user_pub_date_idx')
+        ]
+
+
+class Thumbnail(models.Model):
+    """Заранее уменьшенная картинка поста (см. posts.thumbnails).
+
+    Для каждой картинки строится набор ширин в WebP и в исходном формате.
+    """
+    WEBP = 'webp'
+    JPEG = 'jpeg'
+    PNG = 'png'
+    FORMAT_CHOICES = (
+        (WEBP, 'WebP'),
+        (JPEG, 'JPEG'),
+        (PNG, 'PNG'),
+    )
+    MIME_TYPES = {
+        WEBP: 'image/webp',
+        JPEG: 'image/jpeg',
+        PNG: 'image/png',
+    }
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='thumbnails'
+    )
+    source = models.CharField(
+        'Исходная картинка',
+        max_length=255,
+        help_text='Имя файла картинки поста, из которой сделана миниатюра'
+    )
+    image = models.ImageField(
+        'Миниатюра',
+        upload_to='thumbnails/',
+        width_field='width',
+        height_field='height'
+    )
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+    format = models.CharField(
+        'Формат',
+        max_length=4,
+        choices=FORMAT_CHOICES,
+        default=JPEG
+    )
+
+    class Meta:
+        verbose_name = 'Миниатюра'
+        verbose_name_plural = 'Миниатюры'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'source', 'width', 'format'],
+                name='unique_thumbnail_variant'
+            )
+        ]
+
+    def __str__(self):
+        return self.image.name
+
+
 class Rating(models.Model):
     rat = models.IntegerField()
     author = models.ForeignKey(
@@ -115,10 +279,118 @@ class Rating(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['author'], name='unique_rating'
+            )
+        ]
+
     def __str__(self):
         return str(self.rat)
 
 
-class SetRating(models.Model):
-    user = models.CharField(max_length=100)
-    author = models.CharField(max_length=100)
+class Profile(models.Model):
+    """Денормализованные данные пользователя, читаемые вместе с ним."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='profile'
+    )
+    rating = models.IntegerField(
+        'Рейтинг',
+        default=0,
+        db_index=True
+    )
+    decayed_rating = models.FloatField(
+        'Рейтинг с затуханием',
+        default=0
+    )
+    post_count = models.PositiveIntegerField(
+        'Число постов',
+        default=0
+    )
+    follower_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0,
+        db_index=True
+    )
+    following_count = models.PositiveIntegerField(
+        'Число подписок',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Профиль'
+        verbose_name_plural = 'Профили'
+
+    def __str__(self):
+        return str(self.user)
+
+    @property
+    def score(self):
+        """Рейтинг для показа на страницах."""
+        if settings.RATING_USE_DECAYED:
+            return self.decayed_rating
+        return self.rating
+
+
+class VoteQuerySet(models.QuerySet):
+    def voted_authors(self, user, authors):
+        """Возвращает id тех авторов из authors, за которых user уже голосовал.
+
+        Отвечает на вопрос одним запросом для любого числа авторов.
+        """
+        if not user.is_authenticated:
+            return set()
+        return set(
+            self.filter(user=user, author__in=authors)
+            .values_list('author_id', flat=True)
+        )
+
+
+class Vote(models.Model):
+    UP = 1
+    DOWN = -1
+    LEGACY = 0
+    VALUE_CHOICES = (
+        (UP, 'За'),
+        (DOWN, 'Против'),
+        (LEGACY, 'Неизвестно'),
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='votes'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='received_votes'
+    )
+    value = models.SmallIntegerField(
+        'Голос',
+        choices=VALUE_CHOICES
+    )
+    created = models.DateTimeField(
+        'Дата голоса',
+        auto_now_add=True
+    )
+
+    objects = VoteQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Голос'
+        verbose_name_plural = 'Голоса'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_vote'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} -> {self.author}: {self.value}'
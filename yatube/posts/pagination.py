@@ -0,0 +1,218 @@
+"""Постраничный вывод постов.
+
+Первые PAGINATION_MAX_PAGES страниц открываются по номеру (?page=N),
+номера дальше них и меньше 1 отдают 404. Дальше лента листается
+курсором (?cursor=...): курсор хранит (pub_date, id) крайнего поста, и
+следующая страница выбирается условием по индексу вместо OFFSET.
+
+Число постов главной ленты и ленты группы берётся из кеша; сигналы
+сохранения и удаления постов поправляют его через adjust_counts после
+фиксации транзакции. Число постов автора уже хранит Profile.post_count.
+"""
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(obj, direction=NEXT, field='pub_date'):
+    raw = f'{direction}|{getattr(obj, field).isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (direction, дата, pk) или None для битого курсора."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, pub_date, pk = raw.decode().split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+class CursorPage:
+    """Страница, выбранная по курсору; повторяет интерфейс Page."""
+    cursor_mode = True
+
+    def __init__(self, object_list, has_next, has_previous,
+                 field='pub_date'):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.field = field
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return encode_cursor(self.object_list[-1], NEXT, self.field)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return encode_cursor(self.object_list[0], PREVIOUS, self.field)
+        return None
+
+
+def cursor_page(queryset, token, per_page, field='pub_date'):
+    """Выбирает страницу после (или перед) записью из курсора.
+
+    Записи идут от новых к старым по (field, pk).
+    """
+    cursor = decode_cursor(token) if token else None
+    queryset = queryset.order_by(f'-{field}', '-pk')
+    if cursor is None:
+        objects = list(queryset[:per_page + 1])
+        return CursorPage(objects[:per_page], len(objects) > per_page, False,
+                          field)
+    direction, moment, pk = cursor
+    if direction == NEXT:
+        objects = list(queryset.filter(
+            Q(**{f'{field}__lt': moment})
+            | Q(**{field: moment, 'pk__lt': pk})
+        )[:per_page + 1])
+        return CursorPage(objects[:per_page], len(objects) > per_page, True,
+                          field)
+    objects = list(queryset.filter(
+        Q(**{f'{field}__gt': moment})
+        | Q(**{field: moment, 'pk__gt': pk})
+    ).reverse()[:per_page + 1])
+    has_previous = len(objects) > per_page
+    return CursorPage(objects[:per_page][::-1], True, has_previous, field)
+
+
+COUNT_KEY = 'post-count:{}'
+
+
+def count_names(group_id):
+    """Ленты поста, число постов которых хранится в кеше."""
+    names = ['index']
+    if group_id:
+        names.append(f'group:{group_id}')
+    return names
+
+
+def _adjust(names, delta):
+    for name in names:
+        try:
+            cache.incr(COUNT_KEY.format(name), delta)
+        except ValueError:
+            # Счётчика нет в кеше — посчитается при первом чтении.
+            pass
+
+
+def adjust_counts(names, delta):
+    # До фиксации читатель посчитал бы посты без этой правки и положил
+    # бы в кеш число, которое правка затем сдвинула бы ещё раз.
+    transaction.on_commit(lambda: _adjust(names, delta))
+
+
+class WindowPage(Page):
+    @property
+    def page_window(self):
+        """Номера страниц вокруг текущей, не больше 2 * PAGINATION_WINDOW
+        и не дальше PAGINATION_MAX_PAGES."""
+        window = settings.PAGINATION_WINDOW
+        first = max(1, self.number - window)
+        last = min(self.paginator.num_pages, self.number + window,
+                   settings.PAGINATION_MAX_PAGES)
+        return range(first, last + 1)
+
+    @property
+    def last_by_number(self):
+        """Можно ли открыть последнюю страницу по номеру."""
+        return self.paginator.num_pages <= settings.PAGINATION_MAX_PAGES
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который берёт число постов ленты из кеша."""
+
+    def __init__(self, object_list, per_page, count_name=None, count=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_name = count_name
+        self.known_count = count
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        if self.count_name is None:
+            return super().count
+        key = COUNT_KEY.format(self.count_name)
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.add(key, count, settings.POST_COUNT_TIMEOUT)
+        return count
+
+    def _get_page(self, *args, **kwargs):
+        return WindowPage(*args, **kwargs)
+
+
+def get_page(request, queryset, count_name=None, per_page=None,
+             count=None):
+    """Страница по ?cursor=, а без него — обычная страница по ?page=.
+
+    Номер дальше PAGINATION_MAX_PAGES даёт 404: такие страницы выбирались
+    бы через OFFSET, а листать туда нужно курсором.
+    """
+    per_page = per_page or settings.POSTS_PER_SITE
+    token = request.GET.get('cursor')
+    if token:
+        return cursor_page(queryset, token, per_page)
+    try:
+        number = int(request.GET.get('page') or 1)
+    except ValueError:
+        number = 1
+    if number < 1:
+        # Paginator.get_page отдал бы на такой номер последнюю страницу
+        # через OFFSET.
+        raise Http404('Неверный номер страницы.')
+    if number > settings.PAGINATION_MAX_PAGES:
+        raise Http404('Страница доступна только по курсору.')
+    paginator = CachedCountPaginator(queryset, per_page, count_name, count)
+    page_obj = paginator.get_page(number)
+    page_obj.cursor_mode = False
+    page_obj.next_by_cursor = (
+        page_obj.has_next()
+        and page_obj.number >= settings.PAGINATION_MAX_PAGES
+    )
+    if page_obj.next_by_cursor:
+        page_obj.next_cursor = encode_cursor(page_obj[len(page_obj) - 1])
+    return page_obj
@@ -0,0 +1,230 @@
+"""Изменение рейтинга авторов.
+
+Голос записывается либо сразу (record_vote), либо через журнал отложенной
+записи (buffer_vote + flush), если включён RATING_WRITE_BEHIND. Журнал —
+файл, в который голоса дописываются по одной JSON-строке. При сбросе
+журнал атомарно переименовывается и переносится в базу пачками: голоса
+пачки и суммарные изменения рейтинга фиксируются вместе, поэтому
+повторная обработка после падения ничего не удваивает. Строки, которые
+не удалось прочитать или записать, откладываются в файл <журнал>.dead.
+"""
+import fcntl
+import json
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F, IntegerField, Value
+
+from . import caching, leaderboard
+from .models import Profile, Rating, User, Vote
+
+BUFFER_SIZE_KEY = 'rating-buffer:size'
+VOTE_KEY = 'rating-buffer:vote:{}:{}'
+VOTE_KEY_TIMEOUT = 60 * 60 * 24
+BATCH_SIZE = 500
+
+
+def add_rating(author_id, value):
+    """Прибавляет value к рейтингу автора одним UPDATE на каждую таблицу."""
+    if not Rating.objects.filter(author_id=author_id).update(
+            rat=F('rat') + value):
+        Rating.objects.get_or_create(author_id=author_id,
+                                     defaults={'rat': 0})
+        Rating.objects.filter(author_id=author_id).update(
+            rat=F('rat') + value)
+    if not Profile.objects.filter(user_id=author_id).update(
+            rating=F('rating') + value):
+        Profile.objects.get_or_create(user_id=author_id)
+        Profile.objects.filter(user_id=author_id).update(
+            rating=F('rating') + value)
+    transaction.on_commit(lambda: rating_committed(author_id))
+
+
+def rating_committed(author_id):
+    leaderboard.update(author_id)
+    caching.bump(caching.author_tags(author_id))
+
+
+def record_vote(user, author, delta):
+    """Сразу записывает голос. Возвращает False для повторного голоса."""
+    try:
+        with transaction.atomic():
+            Vote.objects.create(user=user, author=author, value=delta)
+            add_rating(author.pk, delta * settings.RATING_DELTA)
+    except IntegrityError:
+        return False
+    return True
+
+
+def buffer_vote(user, author, delta):
+    """Дописывает голос в журнал. Возвращает False для повторного голоса.
+
+    Повтор отсекается по базе и по ключу в кеше для голосов, которые
+    ещё не сброшены; окончательная проверка выполняется при сбросе.
+    """
+    if Vote.objects.filter(user=user, author=author).exists():
+        return False
+    if not cache.add(VOTE_KEY.format(user.pk, author.pk), True,
+                     VOTE_KEY_TIMEOUT):
+        return False
+    line = json.dumps(
+        {'user': user.pk, 'author': author.pk, 'value': delta}
+    ) + '\n'
+    _append(settings.RATING_BUFFER_PATH, line.encode())
+    cache.add(BUFFER_SIZE_KEY, 0, None)
+    if cache.incr(BUFFER_SIZE_KEY) >= settings.RATING_BUFFER_SIZE:
+        flush()
+    return True
+
+
+def _append(path, data):
+    """Дописывает data в журнал, не теряя строк при его переименовании."""
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            if current is None or current.st_ino != os.fstat(fd).st_ino:
+                # Журнал успели забрать на сброс, пишем в новый.
+                continue
+            os.write(fd, data)
+            os.fsync(fd)
+            return
+        finally:
+            os.close(fd)
+
+
+def _take_log(path, pending):
+    """Переименовывает журнал в pending, дождавшись текущих записей."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.replace(path, pending)
+    finally:
+        os.close(fd)
+    return True
+
+
+def _dead_letter(path, lines):
+    """Откладывает строки журнала, которые не удалось учесть, в path.dead.
+
+    Такие строки не повторяются при следующем сбросе и не задерживают
+    остальные голоса; их можно разобрать и дописать в журнал вручную.
+    """
+    if lines:
+        _append(path + '.dead', b''.join(lines))
+
+
+def _read_votes(pending):
+    """Голоса из журнала и строки, которые не удалось прочитать."""
+    votes = {}
+    bad = []
+    with open(pending, 'rb') as log:
+        for line in log:
+            try:
+                record = json.loads(line)
+                key = (int(record['user']), int(record['author']))
+                value = int(record['value'])
+            except (ValueError, KeyError, TypeError):
+                # Недописанная строка после падения процесса или мусор.
+                if line.strip():
+                    bad.append(line if line.endswith(b'\n')
+                               else line + b'\n')
+                continue
+            if key[0] != key[1]:
+                votes.setdefault(key, value)
+    return votes, bad
+
+
+def _line(key, value):
+    return (json.dumps({'user': key[0], 'author': key[1],
+                        'value': value}) + '\n').encode()
+
+
+def _apply_batch(votes, chunk):
+    """Учитывает пачку голосов одной транзакцией; возвращает их число.
+
+    Голоса удалённых пользователей и за удалённых авторов отбрасываются:
+    иначе INSERT падал бы на внешнем ключе при каждом сбросе.
+    """
+    user_ids = {user_id for user_id, _ in chunk}
+    author_ids = {author_id for _, author_id in chunk}
+    # Одним запросом: уже записанные голоса (user_id, author_id) и
+    # существующие пользователи (pk, 0) — id пользователя не бывает 0.
+    rows = set(
+        Vote.objects.filter(user_id__in=user_ids, author_id__in=author_ids)
+        .values_list('user_id', 'author_id')
+        .union(User.objects.filter(pk__in=user_ids | author_ids)
+               .values_list('pk', Value(0, output_field=IntegerField())))
+    )
+    alive = {user_id for user_id, marker in rows if marker == 0}
+    new_votes = [
+        Vote(user_id=user_id, author_id=author_id,
+             value=votes[user_id, author_id])
+        for user_id, author_id in chunk
+        if (user_id, author_id) not in rows
+        and user_id in alive and author_id in alive
+    ]
+    deltas = Counter()
+    for vote in new_votes:
+        deltas[vote.author_id] += vote.value * settings.RATING_DELTA
+    with transaction.atomic():
+        Vote.objects.bulk_create(new_votes)
+        for author_id, delta in deltas.items():
+            if delta:
+                add_rating(author_id, delta)
+    return len(new_votes)
+
+
+def _apply(votes, path):
+    """Учитывает голоса пачками; пачку с ошибкой откладывает в path.dead.
+
+    Каждая пачка фиксируется отдельно вместе со своими изменениями
+    рейтинга, поэтому повторная обработка журнала после падения
+    пропускает уже записанные голоса и ничего не удваивает.
+    """
+    applied = 0
+    keys = list(votes)
+    for start in range(0, len(keys), BATCH_SIZE):
+        chunk = keys[start:start + BATCH_SIZE]
+        try:
+            applied += _apply_batch(votes, chunk)
+        except DatabaseError:
+            _dead_letter(path, [_line(key, votes[key]) for key in chunk])
+    return applied
+
+
+def flush():
+    """Переносит голоса из журнала в базу.
+
+    Возвращает число учтённых голосов; повторные голоса отбрасываются.
+    """
+    path = settings.RATING_BUFFER_PATH
+    pending = path + '.flushing'
+    lock_fd = os.open(path + '.lock', os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Журнал уже сбрасывает другой процесс.
+            return 0
+        if not os.path.exists(pending):
+            cache.set(BUFFER_SIZE_KEY, 0, None)
+            if not _take_log(path, pending):
+                return 0
+        votes, bad = _read_votes(pending)
+        _dead_letter(path, bad)
+        applied = _apply(votes, path)
+        os.remove(pending)
+        return applied
+    finally:
+        os.close(lock_fd)
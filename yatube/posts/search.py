@@ -0,0 +1,261 @@
+"""Полнотекстовый поиск по постам и комментариям.
+
+Тексты индексируются в виртуальных таблицах SQLite FTS5 с внешним
+содержимым (posts_post_fts, posts_comment_fts): сами тексты остаются в
+posts_post и posts_comment, а индекс поддерживают триггеры из миграции.
+Результаты — посты, упорядоченные по bm25; совпадение в комментарии
+весит меньше совпадения в самом посте. Следующая страница выбирается
+курсором (score, id) без OFFSET.
+
+На других СУБД таблиц нет, и поиск сводится к LIKE по тексту поста.
+"""
+import base64
+import binascii
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+from .models import Post
+
+# Во сколько раз совпадение в комментарии слабее совпадения в посте.
+COMMENT_WEIGHT = 0.5
+
+TABLES = {
+    'posts_post_fts': 'posts_post',
+    'posts_comment_fts': 'posts_comment',
+}
+
+CREATE_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+        text, content='{table}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {fts}_au
+    AFTER UPDATE OF text ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text);
+    END""",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS {fts}_ai',
+    'DROP TRIGGER IF EXISTS {fts}_ad',
+    'DROP TRIGGER IF EXISTS {fts}_au',
+    'DROP TABLE IF EXISTS {fts}',
+]
+
+SEARCH_SQL = f"""
+SELECT post_id, MIN(score) AS best FROM (
+    SELECT rowid AS post_id, bm25(posts_post_fts) AS score
+    FROM posts_post_fts WHERE posts_post_fts MATCH %s
+    UNION ALL
+    SELECT comment.post_id, bm25(posts_comment_fts) * {COMMENT_WEIGHT}
+    FROM posts_comment_fts
+    JOIN posts_comment AS comment ON comment.id = posts_comment_fts.rowid
+    WHERE posts_comment_fts MATCH %s
+)
+GROUP BY post_id
+{{having}}
+ORDER BY best, post_id
+LIMIT %s
+"""
+
+
+def available(using=None):
+    return (using or connection).vendor == 'sqlite'
+
+
+def create_index(schema_editor):
+    if available(schema_editor.connection):
+        for fts, table in TABLES.items():
+            for sql in CREATE_SQL:
+                schema_editor.execute(sql.format(fts=fts, table=table))
+        rebuild(schema_editor.connection)
+
+
+def ensure_index(using=None):
+    """Восстанавливает триггеры, если миграция пересоздала таблицу.
+
+    SQLite меняет схему, копируя таблицу в новую, и триггеры старой
+    таблицы пропадают вместе с ней. Тогда индекс отстал от данных и
+    строится заново.
+    """
+    using = using or connection
+    if (not available(using)
+            or 'posts_post_fts' not in using.introspection.table_names()):
+        return
+    names = [f'{fts}_{suffix}' for fts in TABLES
+             for suffix in ('ai', 'ad', 'au')]
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' "
+            f"AND name IN ({', '.join(['%s'] * len(names))})",
+            names
+        )
+        if cursor.fetchone()[0] == len(names):
+            return
+    with using.schema_editor() as schema_editor:
+        create_index(schema_editor)
+
+
+def drop_index(schema_editor):
+    if available(schema_editor.connection):
+        for fts in TABLES:
+            for sql in DROP_SQL:
+                schema_editor.execute(sql.format(fts=fts))
+
+
+@contextmanager
+def bulk_load(using=None):
+    """Отключает триггеры индекса на время массовой загрузки.
+
+    Триггер на каждую строку — самая дорогая часть вставки. Вместо него
+    на выходе строки, добавленные за это время (id больше прежнего
+    максимума), индексируются одним INSERT ... SELECT на таблицу, и
+    триггеры возвращаются, даже если загрузка упала на середине.
+    Записи с сайта, сделанные во время загрузки, тоже попадут в индекс.
+    """
+    using = using or connection
+    if (not available(using)
+            or 'posts_post_fts' not in using.introspection.table_names()):
+        yield
+        return
+    # Максимум id и удаление триггера — в одной транзакции, чтобы ни
+    # одна строка не попала в индекс дважды.
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        marks = {}
+        for fts, table in TABLES.items():
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+            marks[fts] = cursor.fetchone()[0]
+            cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_ai')
+    try:
+        yield
+    finally:
+        with transaction.atomic(using=using.alias), using.cursor() as cursor:
+            for fts, table in TABLES.items():
+                cursor.execute(
+                    f'INSERT INTO {fts}(rowid, text) '
+                    f'SELECT id, text FROM {table} WHERE id > %s',
+                    [marks[fts]]
+                )
+                cursor.execute(CREATE_SQL[1].format(fts=fts, table=table))
+
+
+def rebuild(using=None):
+    """Заново строит индексы из posts_post и posts_comment."""
+    with (using or connection).cursor() as cursor:
+        for fts in TABLES:
+            cursor.execute(
+                f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"
+            )
+            cursor.execute(
+                f"INSERT INTO {fts}({fts}) VALUES ('optimize')"
+            )
+
+
+def match_query(query):
+    """Превращает ввод пользователя в запрос FTS5: все слова, как есть.
+
+    Каждое слово берётся в кавычки, поэтому операторы и спецсимволы FTS5
+    (AND, NEAR, *, скобки, двоеточия) ищутся как обычный текст.
+    """
+    words = query.split()
+    return ' '.join('"{}"'.format(word.replace('"', '""'))
+                    for word in words)
+
+
+def encode_cursor(score, pk):
+    raw = f'{score!r}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (score, pk) или None для битого курсора."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        score, pk = raw.decode().split('|')
+        return float(score), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class SearchPage:
+    """Страница результатов поиска; повторяет интерфейс Page."""
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _ranked_ids(match, cursor, limit):
+    params = [match, match]
+    having = ''
+    if cursor is not None:
+        having = 'HAVING best > %s OR (best = %s AND post_id > %s)'
+        score, pk = cursor
+        params += [score, score, pk]
+    params.append(limit)
+    with connection.cursor() as db:
+        db.execute(SEARCH_SQL.format(having=having), params)
+        return db.fetchall()
+
+
+def _like_ids(query, cursor, limit):
+    # Без FTS5 ранжировать нечем: все совпадения равны, порядок по id.
+    posts = Post.objects.filter(text__icontains=query).order_by('pk')
+    if cursor is not None:
+        posts = posts.filter(pk__gt=cursor[1])
+    return [(pk, 0.0) for pk in posts.values_list('pk', flat=True)[:limit]]
+
+
+def search(query, token=None, per_page=10):
+    """Ищет посты по словам запроса и отдаёт страницу SearchPage."""
+    match = match_query(query)
+    if not match:
+        return SearchPage([], None)
+    cursor = decode_cursor(token) if token else None
+    if available():
+        rows = _ranked_ids(match, cursor, per_page + 1)
+    else:
+        rows = _like_ids(query, cursor, per_page + 1)
+    posts = Post.objects.for_page().in_bulk([pk for pk, _ in rows])
+    object_list = [posts[pk] for pk, _ in rows[:per_page] if pk in posts]
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor(rows[per_page - 1][1],
+                                    rows[per_page - 1][0])
+    return SearchPage(object_list, next_cursor)
+
+
+def filter_posts(queryset, query):
+    """Оставляет в queryset постов только совпавшие с запросом."""
+    match = match_query(query)
+    if not match:
+        return queryset
+    if not available():
+        return queryset.filter(text__icontains=query)
+    return queryset.extra(
+        where=['posts_post.id IN (SELECT rowid FROM posts_post_fts '
+               'WHERE posts_post_fts MATCH %s)'],
+        params=[match],
+    )
@@ -0,0 +1,186 @@
+import threading
+
+from django.db import connections
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import caching, counters, feed, leaderboard, search, trending
+from .caching import list_tags
+from .models import (Comment, Follow, Group, Post, Profile, Rating,
+                     Thumbnail, User)
+from .pagination import adjust_counts, count_names
+
+UNKNOWN = object()
+
+# Id постов, которые удаляются в этом потоке: их комментарии удаляются
+# каскадом, и счётчик комментариев и кеш поста трогать незачем.
+_deleting = threading.local()
+
+
+def deleting_posts():
+    if not hasattr(_deleting, 'post_ids'):
+        _deleting.post_ids = set()
+    return _deleting.post_ids
+
+
+@receiver(post_save, sender=User)
+def create_profile(sender, instance, created, **kwargs):
+    if created:
+        Profile.objects.get_or_create(user=instance)
+        leaderboard.update(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def seed_trending(sender, instance, created, **kwargs):
+    if created:
+        trending.seed(instance)
+
+
+# Поля пользователя, которые выводятся в карточке каждого его поста.
+USER_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def loaded_names(instance):
+    return {name: instance.__dict__.get(name, UNKNOWN)
+            for name in USER_NAME_FIELDS}
+
+
+@receiver(post_init, sender=User)
+def remember_names(sender, instance, **kwargs):
+    instance._loaded_names = loaded_names(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    renamed = any(
+        value not in (UNKNOWN, getattr(instance, name))
+        for name, value in instance._loaded_names.items()
+    )
+    if not created and renamed:
+        caching.bump([f'user:{instance.pk}',
+                      *caching.author_tags(instance.pk)])
+    instance._loaded_names = loaded_names(instance)
+
+
+@receiver(post_init, sender=Post)
+def remember_loaded_fields(sender, instance, **kwargs):
+    # Отложенные поля (only/defer) не читаем: это был бы запрос на пост.
+    instance._loaded_group_id = instance.__dict__.get('group_id', UNKNOWN)
+    instance._loaded_author_id = instance.__dict__.get('author_id', UNKNOWN)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    tags = list_tags(instance.group_id, instance.author_id)
+    if created:
+        adjust_counts(count_names(instance.group_id), 1)
+        counters.add_posts(instance.author_id, 1)
+    elif instance._loaded_author_id not in (UNKNOWN, instance.author_id):
+        # Пост передан другому автору: обе ленты авторов меняются целиком.
+        counters.add_posts(instance._loaded_author_id, -1)
+        counters.add_posts(instance.author_id, 1)
+        tags.append(f'author:{instance._loaded_author_id}')
+    if (not created
+            and instance._loaded_group_id not in (UNKNOWN,
+                                                  instance.group_id)):
+        if instance._loaded_group_id:
+            adjust_counts([f'group:{instance._loaded_group_id}'], -1)
+            tags.append(f'group:{instance._loaded_group_id}')
+        if instance.group_id:
+            adjust_counts([f'group:{instance.group_id}'], 1)
+    caching.bump(tags + [f'post:{instance.pk}'])
+    instance._loaded_group_id = instance.group_id
+    instance._loaded_author_id = instance.author_id
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting_posts().discard(instance.pk)
+    group_id = instance._loaded_group_id
+    if group_id is UNKNOWN:
+        group_id = instance.group_id
+    tags = list_tags(group_id, instance.author_id)
+    adjust_counts(count_names(group_id), -1)
+    counters.add_posts(instance.author_id, -1)
+    caching.bump(tags + [f'post:{instance.pk}'])
+
+
+@receiver(post_delete, sender=Thumbnail)
+def thumbnail_deleted(sender, instance, **kwargs):
+    instance.image.delete(save=False)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def rating_changed(sender, instance, **kwargs):
+    caching.bump(caching.author_tags(instance.author_id))
+
+
+def comment_count_changed(comment, delta):
+    counters.add_comments(comment.post_id, delta)
+    post = (Post.objects.filter(pk=comment.post_id)
+            .values_list('group_id', 'author_id').first())
+    tags = [f'post:{comment.post_id}']
+    if post is not None:
+        # Число комментариев выводится в карточке поста во всех лентах.
+        tags += list_tags(*post)
+    caching.bump(tags)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        comment_count_changed(instance, 1)
+        trending.comment_added(instance.post_id)
+    else:
+        caching.bump([f'post:{instance.post_id}'])
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in deleting_posts():
+        return
+    comment_count_changed(instance, -1)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Название группы выводится у каждого её поста во всех лентах.
+    caching.bump([caching.ALL])
+
+
+def follow_tags(follow):
+    # Подписка меняет счётчик подписчиков автора и счётчик подписок
+    # подписчика: оба выводятся на страницах профилей.
+    return [f'author:{follow.author_id}', f'author:{follow.user_id}']
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.add_follow(instance.user_id, instance.author_id, 1)
+        caching.bump(follow_tags(instance))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.add_follow(instance.user_id, instance.author_id, -1)
+    caching.bump(follow_tags(instance))
+    feed.author_unfollowed(instance.author_id)
+
+
+def restore_search_index(sender, using, **kwargs):
+    search.ensure_index(connections[using])
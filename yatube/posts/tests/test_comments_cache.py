@@ -1,8 +1,16 @@
+import hashlib
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
+from core.middleware import PAGE_KEY
+
+from .. import counters
 from ..models import Comment, Group, Post
 
 User = get_user_model()
@@ -70,15 +78,216 @@ class PostContextTests(TestCase):
         self.assertEqual(form_data['text'], last_object.text)
 
     def test_index_page_cache(self):
+        cache.clear()
         Post.objects.create(text='Тестовый текст',
                             author=self.user,
                             group=self.group
                             )
         response = self.guest_client.get(reverse('posts:index'))
+        # Правка в обход сигналов не меняет поколение — фрагмент из кеша.
+        Post.objects.update(text='Изменённый текст')
+        response_cache = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(response.content, response_cache.content)
         last_object = Post.objects.latest('id')
         last_object.delete()
-        response_cache = self.guest_client.get(reverse('posts:index'))
-        cache.clear()
         response_no_cache = self.guest_client.get(reverse('posts:index'))
-        self.assertEqual(response.content, response_cache.content)
         self.assertNotEqual(response.content, response_no_cache.content)
+        self.assertContains(response_no_cache, 'Изменённый текст')
+
+    def test_group_and_profile_pages_cache(self):
+        urls = [
+            reverse('posts:group_slug', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                self.guest_client.get(url)
+                Post.objects.filter(pk=self.post.pk).update(text='Другой')
+                self.assertNotContains(self.guest_client.get(url), 'Другой')
+                Post.objects.get(pk=self.post.pk).save()
+                self.assertContains(self.guest_client.get(url), 'Другой')
+                Post.objects.filter(pk=self.post.pk).update(
+                    text=self.post.text)
+
+
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.post = Post.objects.create(text='Тестовый текст', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post.pk})
+
+    def test_guest_gets_page_from_cache(self):
+        self.guest_client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(self.url)
+        self.assertContains(response, 'Тестовый текст')
+
+    def test_comment_purges_cached_page(self):
+        self.guest_client.get(self.url)
+        Comment.objects.create(text='Новый комментарий', author=self.user,
+                               post=self.post)
+        self.assertContains(self.guest_client.get(self.url),
+                            'Новый комментарий')
+
+    def test_list_pages_are_tagged_with_shown_objects(self):
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        tags, _ = cache.get(PAGE_KEY.format(
+            hashlib.md5(url.encode()).hexdigest()
+        ))
+        self.assertIn(f'post:{self.post.pk}', tags)
+        self.assertIn(f'user:{self.user.pk}', tags)
+
+    def test_username_change_purges_lists(self):
+        other = User.objects.create_user(username='Other')
+        Post.objects.create(text='Чужой пост', author=other)
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        etag = self.guest_client.get(url)['ETag']
+        other.username = 'Renamed'
+        other.save()
+        response = self.guest_client.get(url)
+        self.assertContains(response, 'Renamed')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_full_name_change_purges_lists(self):
+        other = User.objects.create_user(username='Other')
+        Post.objects.create(text='Чужой пост', author=other)
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        etag = self.guest_client.get(url)['ETag']
+        other.first_name = 'Новое'
+        other.save()
+        response = self.guest_client.get(url)
+        self.assertContains(response, 'Новое')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_authorized_client_bypasses_cache(self):
+        self.guest_client.get(self.url)
+        Post.objects.filter(pk=self.post.pk).update(text='Другой текст')
+        self.assertContains(self.authorized_client.get(self.url),
+                            'Другой текст')
+        self.assertNotContains(self.guest_client.get(self.url),
+                               'Другой текст')
+
+
+class CommentCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.post = Post.objects.create(text='Тестовый текст',
+                                        author=self.user)
+
+    def comment_count(self):
+        self.post.refresh_from_db()
+        return self.post.comment_count
+
+    def test_count_follows_create_and_delete(self):
+        comments = [Comment.objects.create(text='Комментарий',
+                                           author=self.user, post=self.post)
+                    for _ in range(3)]
+        self.assertEqual(self.comment_count(), 3)
+        comments[0].text = 'Правка'
+        comments[0].save()
+        comments[1].delete()
+        self.assertEqual(self.comment_count(), 2)
+        self.assertContains(self.guest_client.get(reverse('posts:index')),
+                            'Комментариев: 2')
+
+    def test_drifted_count_does_not_go_negative(self):
+        comment = Comment.objects.create(text='Комментарий',
+                                          author=self.user, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(comment_count=0)
+        comment.delete()
+        self.assertEqual(self.comment_count(), 0)
+
+    def test_post_delete_skips_per_comment_updates(self):
+        for _ in range(3):
+            Comment.objects.create(text='Комментарий', author=self.user,
+                                   post=self.post)
+        with mock.patch.object(counters, 'add_comments') as add_comments:
+            self.post.delete()
+        add_comments.assert_not_called()
+        self.assertFalse(Comment.objects.exists())
+        comment = Comment.objects.create(
+            text='Комментарий', author=self.user,
+            post=Post.objects.create(text='Другой', author=self.user)
+        )
+        comment.delete()
+        self.assertEqual(Post.objects.get().comment_count, 0)
+
+    def test_repair_counters_fixes_drift(self):
+        Comment.objects.create(text='Комментарий', author=self.user,
+                               post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(comment_count=7)
+        out = StringIO()
+        call_command('repair_counters', dry_run=True, stdout=out)
+        self.assertEqual(self.comment_count(), 7)
+        call_command('repair_counters', stdout=out)
+        self.assertEqual(self.comment_count(), 1)
+        self.assertIn('Исправлено счётчиков: 1', out.getvalue())
+
+
+@override_settings(COMMENTS_PER_PAGE=2)
+class PaginatedCommentsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.post = Post.objects.create(text='Тестовый текст', author=cls.user)
+        cls.comments = [
+            Comment.objects.create(text=f'Комментарий {i}', author=cls.user,
+                                   post=cls.post)
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_comments_are_loaded_by_cursor(self):
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        seen = [comment.pk for comment in response.context['comments']]
+        cursor = response.context['comments'].next_cursor
+        url = reverse('posts:comments_fragment',
+                      kwargs={'post_id': self.post.pk})
+        while cursor:
+            response = self.guest_client.get(url, {'cursor': cursor})
+            self.assertNotContains(response, '<html')
+            seen += [comment.pk for comment in response.context['comments']]
+            cursor = response.context['comments'].next_cursor
+        self.assertEqual(seen, [comment.pk for comment
+                                in reversed(self.comments)])
+
+    def test_ajax_comment_returns_fragment(self):
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.pk})
+        response = self.authorized_client.post(
+            url, {'text': 'Новый комментарий'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertContains(response, 'Новый комментарий', status_code=201)
+        self.assertNotContains(response, '<html', status_code=201)
+        response = self.authorized_client.post(
+            url, {'text': ''}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 400)
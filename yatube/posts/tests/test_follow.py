@@ -1,8 +1,14 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ..models import Follow, Group, Post, User
+from ..models import FeedItem, Follow, Group, Post, Profile, User
 
 User = get_user_model()
 
@@ -70,3 +76,132 @@ class FollowTests(TestCase):
         response = self.author_client.get(reverse('posts:follow_index'))
         posts_new_count = len(response.context['page_obj'])
         self.assertEqual(posts_count, posts_new_count)
+
+    def test_follow_backfills_and_unfollow_prunes_feed(self):
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}
+        ))
+        self.assertTrue(FeedItem.objects.filter(
+            user=self.user, post=self.post).exists())
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author}
+        ))
+        self.assertFalse(FeedItem.objects.filter(user=self.user).exists())
+
+    def test_new_post_fans_out_to_followers(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(author=self.author, text='Test text')
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], post)
+
+    @override_settings(FEED_MAX_ITEMS=1)
+    def test_backfill_respects_cap(self):
+        Post.objects.create(author=self.author, text='Test text')
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}
+        ))
+        self.assertEqual(FeedItem.objects.filter(user=self.user).count(), 1)
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_celebrity_posts_are_read_on_request(self):
+        cache.clear()
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(author=self.author, text='Test text')
+        self.assertFalse(FeedItem.objects.exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], post)
+        cache.clear()
+
+    @override_settings(FEED_MAX_ITEMS=1)
+    def test_fan_out_trims_feeds(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(author=self.author, text='Первый')
+        latest = Post.objects.create(author=self.author, text='Второй')
+        self.assertEqual(
+            list(FeedItem.objects.filter(user=self.user)
+                 .values_list('post', flat=True)),
+            [latest.pk]
+        )
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_celebrity_posts_are_merged_with_feed_items(self):
+        cache.clear()
+        other = User.objects.create_user(username='Other')
+        regular = User.objects.create_user(username='Regular')
+        Follow.objects.create(user=other, author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=regular)
+        posts = [
+            Post.objects.create(author=author, text=f'Пост {i}')
+            for i, author in enumerate([regular, self.author] * 3)
+        ]
+        self.assertFalse(FeedItem.objects.filter(
+            post__author=self.author).exclude(post=self.post).exists())
+        seen = []
+        cursor = None
+        with override_settings(POSTS_PER_SITE=4):
+            while True:
+                response = self.authorized_client.get(
+                    reverse('posts:follow_index'), {'cursor': cursor or ''})
+                page_obj = response.context['page_obj']
+                seen += list(page_obj)
+                cursor = page_obj.next_cursor
+                if not cursor:
+                    break
+            response = self.authorized_client.get(
+                reverse('posts:follow_index'),
+                {'cursor': page_obj.previous_cursor})
+        self.assertEqual(seen, posts[::-1] + [self.post])
+        self.assertEqual(list(response.context['page_obj']), seen[:4])
+        cache.clear()
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_posts_fan_out_when_author_stops_being_celebrity(self):
+        cache.clear()
+        other = User.objects.create_user(username='Other')
+        Follow.objects.create(user=other, author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(author=self.author, text='Test text')
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
+        Follow.objects.filter(user=other).delete()
+        self.assertTrue(FeedItem.objects.filter(user=self.user,
+                                                post=post).exists())
+        cache.clear()
+
+    def profile_counts(self, user):
+        profile = Profile.objects.get(user=user)
+        return profile.follower_count, profile.following_count
+
+    def test_follow_counters(self):
+        follow_url = reverse('posts:profile_follow',
+                             kwargs={'username': self.author})
+        unfollow_url = reverse('posts:profile_unfollow',
+                               kwargs={'username': self.author})
+        self.authorized_client.get(follow_url)
+        self.authorized_client.get(follow_url)
+        self.assertEqual(self.profile_counts(self.author), (1, 0))
+        self.assertEqual(self.profile_counts(self.user), (0, 1))
+        self.authorized_client.get(unfollow_url)
+        self.authorized_client.get(unfollow_url)
+        self.assertEqual(self.profile_counts(self.author), (0, 0))
+        self.assertEqual(self.profile_counts(self.user), (0, 0))
+
+    def test_profile_header_has_no_follow_queries(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        url = reverse('posts:profile', kwargs={'username': self.author})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url)
+        self.assertTrue(response.context['following'])
+        self.assertContains(response, 'Подписчиков: 1')
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith('SELECT')
+                          and 'COUNT(' in query['sql']
+                          and 'posts_follow' in query['sql']])
+
+    def test_repair_counters_fixes_follow_counts(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Profile.objects.filter(user=self.author).update(follower_count=9)
+        Profile.objects.filter(user=self.user).update(following_count=0)
+        call_command('repair_counters', stdout=StringIO())
+        self.assertEqual(self.profile_counts(self.author), (1, 0))
+        self.assertEqual(self.profile_counts(self.user), (0, 1))
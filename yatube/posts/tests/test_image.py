@@ -1,13 +1,23 @@
+import io
+import os
 import shutil
 import tempfile
+from io import StringIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail.conf import settings as sorl_settings
 
-from ..models import Group, Post
+from .. import thumbnails
+from ..models import Group, Post, Thumbnail
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -89,3 +99,172 @@ class ContextImageTests(TestCase):
         )
         first_object = response.context['post']
         self.assertEqual(first_object.image, 'posts/small.gif')
+
+
+def jpeg(name, size=(1200, 800)):
+    output = io.BytesIO()
+    Image.new('RGB', size, 'red').save(output, 'JPEG')
+    return SimpleUploadedFile(name, output.getvalue(),
+                              content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.post = Post.objects.create(text='Текст', author=self.user,
+                                        image=jpeg('photo.jpg'))
+
+    def detail(self):
+        return self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        ).content.decode()
+
+    @override_settings(POST_THUMBNAIL_WIDTHS=(330, 990))
+    def test_sorl_thumbnail_is_shown_until_thumbnails_are_ready(self):
+        page = self.detail()
+        self.assertNotIn(self.post.image.url, page)
+        self.assertIn(
+            settings.MEDIA_URL + sorl_settings.THUMBNAIL_PREFIX, page
+        )
+        created = thumbnails.generate(self.post.pk)
+        self.assertEqual(
+            sorted((thumbnail.format, thumbnail.width, thumbnail.height)
+                   for thumbnail in created),
+            [('jpeg', 330, 113), ('jpeg', 990, 339),
+             ('webp', 330, 113), ('webp', 990, 339)]
+        )
+        page = self.detail()
+        self.assertNotIn(self.post.image.url, page)
+        webp = {thumbnail.width: thumbnail.image.url
+                for thumbnail in created if thumbnail.format == 'webp'}
+        self.assertIn(
+            f'<source type="image/webp" '
+            f'srcset="{webp[330]} 330w, {webp[990]} 990w"', page
+        )
+        self.assertIn('width="990" height="339"', page)
+
+    def test_png_keeps_its_format(self):
+        output = io.BytesIO()
+        Image.new('RGBA', (400, 400), (0, 0, 255, 128)).save(output, 'PNG')
+        self.post.image = SimpleUploadedFile('logo.png', output.getvalue(),
+                                             content_type='image/png')
+        self.post.save()
+        formats = {thumbnail.format
+                   for thumbnail in thumbnails.generate(self.post.pk)}
+        self.assertEqual(formats, {'webp', 'png'})
+
+    def test_new_image_replaces_stale_thumbnails(self):
+        old = thumbnails.generate(self.post.pk)
+        self.assertEqual(thumbnails.generate(self.post.pk), [])
+        self.post.image = jpeg('other.jpg', size=(300, 600))
+        self.post.save()
+        new = thumbnails.generate(self.post.pk)
+        self.assertEqual(set(self.post.thumbnails.all()), set(new))
+        self.assertFalse(os.path.exists(old[0].image.path))
+        self.assertEqual({thumbnail.source for thumbnail in new},
+                         {self.post.image.name})
+
+    def test_opaque_png_falls_back_to_jpeg(self):
+        output = io.BytesIO()
+        Image.new('RGB', (400, 400), (0, 0, 255)).save(output, 'PNG')
+        self.post.image = SimpleUploadedFile('flat.png', output.getvalue(),
+                                             content_type='image/png')
+        self.post.save()
+        formats = {thumbnail.format
+                   for thumbnail in thumbnails.generate(self.post.pk)}
+        self.assertEqual(formats, {'webp', 'jpeg'})
+
+    def test_changed_widths_are_backfilled(self):
+        with self.settings(POST_THUMBNAIL_WIDTHS=(330, 660, 990)):
+            thumbnails.generate(self.post.pk)
+            self.assertNotIn(self.post, thumbnails.missing())
+        with self.settings(POST_THUMBNAIL_WIDTHS=(480, 990)):
+            self.assertIn(self.post, thumbnails.missing())
+            added = thumbnails.generate(self.post.pk)
+            self.assertEqual({thumbnail.width for thumbnail in added},
+                             {480})
+            self.assertEqual(
+                set(self.post.thumbnails.values_list('width', flat=True)),
+                {480, 990}
+            )
+            self.assertNotIn(self.post, thumbnails.missing())
+
+    def test_missing_widths_are_added(self):
+        with self.settings(POST_THUMBNAIL_WIDTHS=(990,)):
+            thumbnails.generate(self.post.pk)
+        self.assertIn(self.post, thumbnails.missing())
+        added = thumbnails.generate(self.post.pk)
+        self.assertEqual({thumbnail.width for thumbnail in added},
+                         {330, 660})
+        self.assertNotIn(self.post, thumbnails.missing())
+
+    def test_views_schedule_thumbnails(self):
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Новый', 'image': jpeg('new.jpg')}
+            )
+            self.authorized_client.post(
+                reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+                data={'text': 'Без новой картинки'}
+            )
+        self.assertEqual(schedule.call_count, 1)
+        self.assertEqual(schedule.call_args[0][0].text, 'Новый')
+
+    @mock.patch.object(thumbnails, 'LOCKED_DELAY', 0)
+    def test_pool_retries_when_database_is_locked(self):
+        locked = OperationalError('database is locked')
+        with mock.patch.object(thumbnails, 'generate',
+                               side_effect=[locked, []]) as generate:
+            thumbnails._run(self.post.pk)
+        self.assertEqual(generate.call_count, 2)
+
+    def test_command_skips_broken_images(self):
+        missing_file = Post.objects.create(text='Нет файла',
+                                           author=self.user,
+                                           image='posts/nowhere.jpg')
+        corrupt = Post.objects.create(
+            text='Испорчен', author=self.user,
+            image=SimpleUploadedFile('bad.jpg', b'not an image',
+                                     content_type='image/jpeg')
+        )
+        output = io.BytesIO()
+        Image.new('P', (400, 400)).save(output, 'GIF')
+        gif = Post.objects.create(
+            text='GIF', author=self.user,
+            image=SimpleUploadedFile('ok.gif', output.getvalue(),
+                                     content_type='image/gif')
+        )
+        err = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=StringIO(),
+                     stderr=err)
+        built = set(Thumbnail.objects.values_list('post', flat=True))
+        self.assertEqual(built, {self.post.pk, gif.pk})
+        self.assertIn(f'пост {missing_file.pk}', err.getvalue())
+        self.assertIn(f'пост {corrupt.pk}', err.getvalue())
+
+    def test_command_builds_missing_thumbnails(self):
+        Post.objects.create(text='Без картинки', author=self.user)
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        self.assertEqual(
+            set(Thumbnail.objects.values_list('post', flat=True)),
+            {self.post.pk}
+        )
+        count = Thumbnail.objects.count()
+        out = StringIO()
+        call_command('generate_thumbnails', benchmark=3, stdout=out)
+        self.assertIn('в секунду', out.getvalue())
+        self.assertEqual(Thumbnail.objects.count(), count)
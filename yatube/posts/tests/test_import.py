@@ -0,0 +1,130 @@
+import gzip
+import json
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import search
+from ..models import Comment, FeedItem, Follow, Group, Post, Profile
+
+User = get_user_model()
+
+RECORDS = [
+    {'type': 'user', 'username': 'Author'},
+    {'type': 'user', 'username': 'Reader'},
+    {'type': 'group', 'slug': 'cats', 'title': 'Коты'},
+    {'type': 'post', 'id': 'p1', 'author': 'Author', 'group': 'cats',
+     'text': 'Кошка спит на окне', 'pub_date': '2020-01-02T03:04:05+00:00'},
+    {'type': 'post', 'id': 'p2', 'author': 'Author', 'text': 'Без группы'},
+    {'type': 'comment', 'post': 'p1', 'author': 'Reader', 'text': 'Мило'},
+    {'type': 'comment', 'post': 'p1', 'author': 'Author', 'text': 'Да'},
+    {'type': 'follow', 'user': 'Reader', 'author': 'Author'},
+    {'type': 'follow', 'user': 'Reader', 'author': 'Author'},
+    {'type': 'comment', 'post': 'нет такого', 'author': 'Reader',
+     'text': 'Пропадёт'},
+]
+
+
+class ImportMixin:
+    def run_import(self, records, extra_line=''):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson',
+                                         encoding='utf-8') as source:
+            for record in records:
+                source.write(json.dumps(record, ensure_ascii=False) + '\n')
+            source.write(extra_line)
+            source.flush()
+            err = StringIO()
+            call_command('import_ndjson', source.name, stdout=StringIO(),
+                         stderr=err)
+        return err.getvalue()
+
+
+class ImportNdjsonTests(ImportMixin, TestCase):
+    def test_imports_records_and_counters(self):
+        errors = self.run_import(RECORDS, extra_line='{не json\n')
+        author = User.objects.get(username='Author')
+        post = Post.objects.get(text='Кошка спит на окне')
+        self.assertEqual(post.group, Group.objects.get(slug='cats'))
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.comment_count, 2)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(Follow.objects.count(), 1)
+        profile = Profile.objects.get(user=author)
+        self.assertEqual(profile.post_count, 2)
+        self.assertEqual(profile.follower_count, 1)
+        self.assertEqual(
+            Profile.objects.get(user__username='Reader').following_count, 1
+        )
+        self.assertEqual(
+            FeedItem.objects.filter(user__username='Reader').count(), 2
+        )
+        self.assertEqual(errors.count('пропущена'), 2)
+
+    def test_imported_posts_are_searchable(self):
+        self.run_import(RECORDS)
+        found = search.search('кошка')
+        self.assertEqual([post.text for post in found],
+                         ['Кошка спит на окне'])
+
+    def test_existing_users_are_reused(self):
+        author = User.objects.create_user(username='Author')
+        self.run_import(RECORDS[:1] + RECORDS[4:5])
+        self.assertEqual(User.objects.filter(username='Author').count(), 1)
+        self.assertEqual(Profile.objects.get(user=author).post_count, 1)
+
+
+    def test_existing_followers_get_imported_posts(self):
+        author = User.objects.create_user(username='Author')
+        reader = User.objects.create_user(username='Reader')
+        Follow.objects.create(user=reader, author=author)
+        self.run_import(RECORDS[:1] + RECORDS[4:5])
+        self.assertEqual(
+            list(FeedItem.objects.filter(user=reader)
+                 .values_list('post__text', flat=True)),
+            ['Без группы']
+        )
+
+    def test_trending_is_seeded_for_recent_posts(self):
+        records = [dict(record) for record in RECORDS]
+        records[3]['pub_date'] = timezone.now().isoformat()
+        self.run_import(records)
+        recent = Post.objects.get(text='Кошка спит на окне')
+        self.assertGreater(recent.trending_score, 0)
+
+    def test_search_triggers_are_restored(self):
+        self.run_import(RECORDS)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master "
+                           "WHERE type = 'trigger'")
+            triggers = {name for name, in cursor.fetchall()}
+        self.assertIn('posts_post_fts_ai', triggers)
+        Post.objects.create(text='Собака лает',
+                            author=User.objects.get(username='Author'))
+        self.assertEqual([post.text for post in search.search('собака')],
+                         ['Собака лает'])
+
+
+class ExportPostsTests(ImportMixin, TestCase):
+    def test_export_can_be_imported_back(self):
+        author = User.objects.create_user(username='Author')
+        group = Group.objects.create(title='Коты', slug='cats')
+        post = Post.objects.create(text='Кошка', author=author, group=group)
+        Comment.objects.create(text='Мило', post=post, author=author)
+        with tempfile.NamedTemporaryFile(suffix='.ndjson.gz') as target:
+            call_command('export_posts', group='cats', gzip=True,
+                         output=target.name)
+            with gzip.open(target.name, 'rt', encoding='utf-8') as source:
+                records = [json.loads(line) for line in source]
+        Post.objects.all().delete()
+        self.run_import(records)
+        self.assertEqual([record['type'] for record in records],
+                         ['user', 'group', 'post', 'comment'])
+        imported = Post.objects.get()
+        self.assertEqual((imported.text, imported.group, imported.author),
+                         ('Кошка', group, author))
+        self.assertEqual(imported.comment_count, 1)
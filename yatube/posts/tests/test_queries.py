@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class QueryBudgetTests(TestCase):
+    """Число запросов страницы не должно зависеть от числа постов на ней."""
+    PAGE_SIZES = (1, 10, 100)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.group = Group.objects.create(title='Test', slug='test_slug')
+        authors = [User.objects.create_user(username=f'Author{i}')
+                   for i in range(max(cls.PAGE_SIZES))]
+        groups = [Group.objects.create(title=f'Group{i}', slug=f'group{i}')
+                  for i in range(max(cls.PAGE_SIZES))]
+        for author, group in zip(authors, groups):
+            Follow.objects.create(user=cls.user, author=author)
+            Post.objects.create(text='Текст', author=author, group=group)
+            Post.objects.create(text='Текст', author=cls.user,
+                                group=cls.group)
+        cls.post = Post.objects.filter(author=cls.user).first()
+        for author in authors:
+            Comment.objects.create(text='Комментарий', author=author,
+                                   post=cls.post)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def count_queries(self, url, page_size):
+        cache.clear()
+        with self.settings(POSTS_PER_SITE=page_size):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.authorized_client.get(url)
+        self.assertEqual(len(response.context['page_obj']), page_size)
+        return len(queries)
+
+    def assert_constant_queries(self, url):
+        counts = [self.count_queries(url, size) for size in self.PAGE_SIZES]
+        self.assertEqual(len(set(counts)), 1,
+                         f'{url}: {dict(zip(self.PAGE_SIZES, counts))}')
+
+    def test_list_views_have_fixed_query_count(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:index_fragment'),
+            reverse('posts:group_slug', kwargs={'slug': self.group.slug}),
+            reverse('posts:group_fragment',
+                    kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:profile_fragment',
+                    kwargs={'username': self.user}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assert_constant_queries(url)
+
+    def test_post_detail_has_fixed_query_count(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        counts = []
+        for size in reversed(self.PAGE_SIZES):
+            Comment.objects.filter(post=self.post).exclude(
+                pk__in=Comment.objects.filter(post=self.post)
+                .values_list('pk', flat=True)[:size]
+            ).delete()
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.authorized_client.get(url)
+            counts.append(len(queries))
+        self.assertEqual(len(set(counts)), 1, counts)
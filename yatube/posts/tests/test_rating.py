@@ -0,0 +1,331 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.db.models import F
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import leaderboard, ratings
+from ..management.commands import reconcile_ratings
+from ..models import Post, Profile, Rating, Vote
+
+User = get_user_model()
+
+
+class RatingViewsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='TestAuthor')
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.post = Post.objects.create(text='Тестовый текст',
+                                       author=cls.author)
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_profile_created_for_new_user(self):
+        self.assertEqual(self.author.profile.rating, 0)
+
+    def test_rating_inc_updates_rating_and_profile(self):
+        self.authorized_client.get(
+            reverse('posts:rat_inc', kwargs={'author': self.author}))
+        self.assertEqual(Rating.objects.get(author=self.author).rat, 1)
+        self.assertEqual(
+            Profile.objects.get(user=self.author).rating, 1)
+
+    def test_page_posts_have_author_rating(self):
+        Profile.objects.filter(user=self.author).update(rating=5)
+        response = self.guest_client.get(reverse('posts:index'))
+        first_object = response.context['page_obj'][0]
+        with self.assertNumQueries(0):
+            self.assertEqual(first_object.author.profile.rating, 5)
+        self.assertNotIn('rating', response.context)
+
+    def test_profile_rating_only_for_author(self):
+        other = User.objects.create_user(username='OtherAuthor')
+        Profile.objects.filter(user=self.author).update(rating=5)
+        Profile.objects.filter(user=other).update(rating=7)
+        url = reverse('posts:profile', kwargs={'username': self.author})
+        response = self.guest_client.get(url)
+        self.assertEqual(response.context['author'].profile.rating, 5)
+        self.assertNotIn('rating', response.context)
+        header = response.content.decode().split('Рейтинг:')[1]
+        self.assertEqual(header.split()[0], '5')
+        author_client = Client()
+        author_client.force_login(self.author)
+        self.assertNotContains(author_client.get(url), 'Рейтинг:')
+
+    def test_second_vote_is_ignored(self):
+        url = reverse('posts:rat_inc', kwargs={'author': self.author})
+        self.authorized_client.get(url)
+        self.authorized_client.get(
+            reverse('posts:rat_dec', kwargs={'author': self.author}))
+        self.authorized_client.get(url)
+        self.assertEqual(Vote.objects.filter(author=self.author).count(), 1)
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 1)
+
+    def test_self_and_guest_votes_are_rejected(self):
+        author_client = Client()
+        author_client.force_login(self.author)
+        url = reverse('posts:rat_inc', kwargs={'author': self.author})
+        author_client.get(url)
+        self.guest_client.get(url)
+        self.assertFalse(Vote.objects.exists())
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 0)
+
+    def test_voted_authors_single_query(self):
+        other = User.objects.create_user(username='OtherAuthor')
+        Vote.objects.create(user=self.user, author=self.author,
+                            value=Vote.UP)
+        with self.assertNumQueries(1):
+            voted = Vote.objects.voted_authors(
+                self.user, [self.author.pk, other.pk])
+        self.assertEqual(voted, {self.author.pk})
+
+
+class RatingBufferTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='TestAuthor')
+        cls.user = User.objects.create_user(username='TestUser')
+
+    def setUp(self):
+        cache.clear()
+        self.buffer_dir = tempfile.mkdtemp()
+        self.override = override_settings(
+            RATING_WRITE_BEHIND=True,
+            RATING_BUFFER_PATH=os.path.join(self.buffer_dir, 'votes.log'),
+        )
+        self.override.enable()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.buffer_dir, ignore_errors=True)
+
+    def test_vote_is_buffered_until_flush(self):
+        url = reverse('posts:rat_inc', kwargs={'author': self.author})
+        self.authorized_client.get(url)
+        self.authorized_client.get(url)
+        self.assertFalse(Vote.objects.exists())
+        self.assertEqual(ratings.flush(), 1)
+        self.assertEqual(Vote.objects.get().value, Vote.UP)
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 1)
+        self.assertEqual(Rating.objects.get(author=self.author).rat, 1)
+
+    def test_flush_is_idempotent_after_crash(self):
+        ratings.buffer_vote(self.user, self.author, Vote.DOWN)
+        path = settings.RATING_BUFFER_PATH
+        shutil.copy(path, path + '.backup')
+        ratings.flush()
+        # Падение между фиксацией транзакции и удалением журнала.
+        os.replace(path + '.backup', path + '.flushing')
+        self.assertEqual(ratings.flush(), 0)
+        self.assertEqual(Profile.objects.get(user=self.author).rating, -1)
+
+    def test_votes_of_deleted_users_do_not_block_flush(self):
+        voter = User.objects.create_user(username='Voter')
+        gone_author = User.objects.create_user(username='GoneAuthor')
+        ratings.buffer_vote(self.user, gone_author, Vote.UP)
+        ratings.buffer_vote(voter, self.author, Vote.UP)
+        ratings.buffer_vote(self.user, self.author, Vote.UP)
+        gone_author.delete()
+        voter.delete()
+        self.assertEqual(ratings.flush(), 1)
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 1)
+        path = settings.RATING_BUFFER_PATH
+        self.assertFalse(os.path.exists(path + '.flushing'))
+        other = User.objects.create_user(username='Other')
+        ratings.buffer_vote(other, self.author, Vote.UP)
+        self.assertEqual(ratings.flush(), 1)
+
+    def test_unreadable_and_failed_lines_go_to_dead_letter(self):
+        path = settings.RATING_BUFFER_PATH
+        with open(path, 'wb') as log:
+            log.write(b'{"user": 1, "auth\n')
+        ratings.buffer_vote(self.user, self.author, Vote.UP)
+        with mock.patch.object(ratings, '_apply_batch',
+                               side_effect=DatabaseError('locked')):
+            self.assertEqual(ratings.flush(), 0)
+        self.assertFalse(os.path.exists(path + '.flushing'))
+        with open(path + '.dead', 'rb') as dead:
+            lines = dead.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1]), {
+            'user': self.user.pk, 'author': self.author.pk, 'value': 1
+        })
+
+    @override_settings(RATING_BUFFER_SIZE=1)
+    def test_flush_on_size_threshold(self):
+        ratings.buffer_vote(self.user, self.author, Vote.UP)
+        self.assertTrue(Vote.objects.exists())
+
+
+@override_settings(LEADERBOARD_SIZE=2)
+class LeaderboardTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = [
+            User.objects.create_user(username=f'User{i}') for i in range(6)
+        ]
+        for rating, user in enumerate(cls.users):
+            Profile.objects.filter(user=user).update(rating=rating)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_top_is_sorted_by_rating(self):
+        self.assertEqual(
+            [author['username'] for author in leaderboard.top()],
+            ['User5', 'User4']
+        )
+
+    def test_update_moves_author_without_rebuild(self):
+        leaderboard.top()
+        Profile.objects.filter(user=self.users[0]).update(rating=10)
+        leaderboard.update(self.users[0].pk)
+        with self.assertNumQueries(0):
+            top = leaderboard.top()
+        self.assertEqual(top[0], {'user_id': self.users[0].pk,
+                                  'username': 'User0', 'rating': 10})
+
+    def test_update_under_foreign_lock_drops_board(self):
+        leaderboard.top()
+        cache.add(leaderboard.LOCK_KEY, True)
+        Profile.objects.filter(user=self.users[0]).update(rating=10)
+        leaderboard.update(self.users[0].pk)
+        self.assertIsNone(cache.get(leaderboard.LEADERBOARD_KEY))
+        cache.delete(leaderboard.LOCK_KEY)
+        self.assertEqual(leaderboard.top()[0]['username'], 'User0')
+        self.assertIsNotNone(cache.get(leaderboard.LEADERBOARD_KEY))
+
+    def test_update_rebuilds_when_board_runs_short(self):
+        leaderboard.top()
+        for user in self.users[2:]:
+            Profile.objects.filter(user=user).update(rating=-1)
+            leaderboard.update(user.pk)
+        self.assertEqual(
+            [author['username'] for author in leaderboard.top()],
+            ['User1', 'User0']
+        )
+
+    def test_leaderboard_page(self):
+        response = Client().get(reverse('posts:leaderboard'))
+        self.assertEqual(len(response.context['authors']), 2)
+        self.assertContains(response, 'User5')
+
+
+class DecayRatingsTests(TestCase):
+    def test_old_votes_weigh_less(self):
+        author = User.objects.create_user(username='TestAuthor')
+        voters = [User.objects.create_user(username=f'Voter{i}')
+                  for i in range(2)]
+        Vote.objects.create(user=voters[0], author=author, value=Vote.UP)
+        old_vote = Vote.objects.create(user=voters[1], author=author,
+                                       value=Vote.UP)
+        Vote.objects.filter(pk=old_vote.pk).update(
+            created=timezone.now() - timedelta(days=30))
+        call_command('decay_ratings', half_life=30, stdout=StringIO())
+        profile = Profile.objects.get(user=author)
+        self.assertAlmostEqual(profile.decayed_rating, 1.5, places=3)
+        self.assertEqual(Profile.objects.get(user=voters[0]).decayed_rating,
+                         0)
+        with self.settings(RATING_USE_DECAYED=True):
+            self.assertEqual(profile.score, profile.decayed_rating)
+
+
+    def test_legacy_votes_share_unexplained_rating(self):
+        author = User.objects.create_user(username='TestAuthor')
+        voters = [User.objects.create_user(username=f'Voter{i}')
+                  for i in range(3)]
+        Vote.objects.create(user=voters[0], author=author, value=Vote.UP)
+        for voter in voters[1:]:
+            Vote.objects.create(user=voter, author=author, value=Vote.LEGACY)
+        Vote.objects.filter(value=Vote.LEGACY).update(
+            created=timezone.now() - timedelta(days=30))
+        Profile.objects.filter(user=author).update(
+            rating=3 * settings.RATING_DELTA)
+        call_command('decay_ratings', half_life=30, stdout=StringIO())
+        self.assertAlmostEqual(
+            Profile.objects.get(user=author).decayed_rating,
+            settings.RATING_DELTA * (1 + 2 * 0.5), places=3
+        )
+
+
+class ReconcileRatingsTests(TestCase):
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.checkpoint_dir, 'checkpoint')
+        self.author = User.objects.create_user(username='TestAuthor')
+        self.voters = [User.objects.create_user(username=f'Voter{i}')
+                       for i in range(3)]
+        for voter in self.voters:
+            Vote.objects.create(user=voter, author=self.author,
+                                value=Vote.UP)
+
+    def tearDown(self):
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+    def reconcile(self, **options):
+        out = StringIO()
+        call_command('reconcile_ratings', checkpoint=self.checkpoint,
+                     batch_size=2, chunk_size=2, stdout=out, **options)
+        return out.getvalue()
+
+    def test_drifted_totals_are_fixed(self):
+        Profile.objects.filter(user=self.author).update(rating=1)
+        Profile.objects.filter(user=self.voters[0]).update(rating=4)
+        Rating.objects.create(author=self.voters[0], rat=4)
+        output = self.reconcile()
+        self.assertIn('расхождений: 2', output)
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 3)
+        self.assertEqual(Rating.objects.get(author=self.author).rat, 3)
+        self.assertEqual(Rating.objects.get(author=self.voters[0]).rat, 0)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_vote_during_reconcile_is_kept(self):
+        Profile.objects.filter(user=self.author).update(rating=1)
+        reconcile = reconcile_ratings.Command.reconcile
+
+        def vote_after_read(command, profiles, *args):
+            # Голос пришёл, когда профили уже прочитаны.
+            if self.author.pk in [profile.user_id for profile in profiles]:
+                Profile.objects.filter(user=self.author).update(
+                    rating=F('rating') + settings.RATING_DELTA
+                )
+            return reconcile(command, profiles, *args)
+
+        with mock.patch.object(reconcile_ratings.Command, 'reconcile',
+                               vote_after_read):
+            output = self.reconcile()
+        self.assertIn('будет сверен при следующем запуске', output)
+        self.assertEqual(Profile.objects.get(user=self.author).rating,
+                         1 + settings.RATING_DELTA)
+
+    def test_dry_run_changes_nothing(self):
+        output = self.reconcile(dry_run=True)
+        self.assertIn('по голосам 3', output)
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 0)
+
+    def test_resume_skips_checked_authors(self):
+        with open(self.checkpoint, 'w') as checkpoint:
+            checkpoint.write(str(self.author.pk))
+        self.reconcile(resume=True)
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 0)
@@ -0,0 +1,97 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from .. import search
+from ..models import Comment, Post
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.admin = User.objects.create_superuser(
+            username='Admin', email='admin@example.com', password='pass'
+        )
+        cls.post = Post.objects.create(text='Пишу про котов и собак',
+                                       author=cls.user)
+        cls.other = Post.objects.create(text='Пост о погоде',
+                                        author=cls.user)
+        Comment.objects.create(text='А у меня тоже есть коты? Котов',
+                               author=cls.user, post=cls.other)
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def found(self, query, **params):
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': query, **params})
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_post_match_ranks_above_comment_match(self):
+        self.assertEqual(self.found('котов'), [self.post.pk, self.other.pk])
+
+    def test_index_follows_edit_and_delete(self):
+        post = Post.objects.create(text='Редкое слово', author=self.user)
+        self.assertEqual(self.found('редкое'), [post.pk])
+        post.text = 'Другое слово'
+        post.save()
+        self.assertEqual(self.found('редкое'), [])
+        self.assertEqual(self.found('другое'), [post.pk])
+        post.delete()
+        self.assertEqual(self.found('другое'), [])
+
+    def test_operators_are_searched_as_text(self):
+        for query in ('котов OR', 'NEAR(котов', '"котов', 'text:котов', '*'):
+            with self.subTest(query=query):
+                self.assertEqual(
+                    self.guest_client.get(reverse('posts:search'),
+                                          {'q': query}).status_code,
+                    200
+                )
+        self.assertEqual(self.found(''), [])
+
+    @override_settings(POSTS_PER_SITE=2)
+    def test_cursor_walks_all_results(self):
+        posts = [Post.objects.create(text=f'Слон {i}', author=self.user)
+                 for i in range(5)]
+        seen = []
+        cursor = None
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            response = self.guest_client.get(reverse('posts:search'),
+                                             {'q': 'слон', **params})
+            page_obj = response.context['page_obj']
+            seen += [post.pk for post in page_obj]
+            cursor = page_obj.next_cursor
+            if cursor is None:
+                break
+        self.assertCountEqual(seen, [post.pk for post in posts])
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_rebuild_restores_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO posts_post_fts(posts_post_fts) "
+                           "VALUES ('delete-all')")
+        self.assertEqual(self.found('погоде'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.found('погоде'), [self.other.pk])
+
+    def test_admin_search_uses_index(self):
+        client = Client()
+        client.force_login(self.admin)
+        response = client.get(reverse('admin:posts_post_changelist'),
+                              {'q': 'собак'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.post])
+
+    def test_match_query_quotes_every_word(self):
+        self.assertEqual(search.match_query(' a "b  c* '),
+                         '"a" """b" "c*"')
@@ -0,0 +1,63 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from .. import trending
+from ..models import Post, Profile
+
+User = get_user_model()
+
+
+@override_settings(TRENDING_COMMENT_WEIGHT=1.0, TRENDING_RATING_WEIGHT=0.1,
+                   TRENDING_HALF_LIFE_HOURS=24, TRENDING_MIN_SCORE=0.01)
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.author = User.objects.create_user(username='Author')
+        Profile.objects.filter(user=cls.author).update(rating=30)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def comment(self, post):
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            data={'text': 'Комментарий'}
+        )
+
+    def trending(self):
+        response = self.authorized_client.get(reverse('posts:trending'))
+        return list(response.context['posts'])
+
+    def test_score_starts_from_author_rating_and_grows_with_comments(self):
+        rated = Post.objects.create(text='Текст', author=self.author)
+        quiet = Post.objects.create(text='Текст', author=self.user)
+        rated.refresh_from_db()
+        self.assertAlmostEqual(rated.trending_score, 3)
+        self.assertEqual(self.trending(), [rated])
+        for _ in range(4):
+            self.comment(quiet)
+        self.assertEqual(self.trending(), [quiet, rated])
+
+    def test_list_is_one_query(self):
+        for _ in range(3):
+            self.comment(Post.objects.create(text='Текст', author=self.user))
+        with self.assertNumQueries(1):
+            self.assertEqual(len(trending.top()), 3)
+
+    def test_decay_halves_scores_and_drops_stale_posts(self):
+        post = Post.objects.create(text='Текст', author=self.user)
+        self.comment(post)
+        call_command('decay_trending', hours=24, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertAlmostEqual(post.trending_score, 0.5)
+        call_command('decay_trending', hours=24 * 7, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.trending_score, 0)
+        self.assertEqual(self.trending(), [])
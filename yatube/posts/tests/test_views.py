@@ -1,11 +1,17 @@
+from io import StringIO
+
 from django import forms
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
 
 from yatube.settings import POSTS_PER_SITE
 
-from ..models import Group, Post
+from .. import counters
+from ..models import Comment, Group, Post, Profile
 
 User = get_user_model()
 
@@ -161,8 +167,12 @@ class PaginatorViewsTests(TestCase):
                                  author=cls.user,
                                  group=cls.group))
         Post.objects.bulk_create(cls.post)
+        # bulk_create не вызывает сигналы, счётчик постов в профиле
+        # пересчитывается, как после массовой загрузки.
+        counters.recount_profiles(Profile.objects.all())
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -186,3 +196,231 @@ class PaginatorViewsTests(TestCase):
                 self.assertEqual(len(response.context['page_obj']),
                                  self.NUM_PAGES_IN_TEST - POSTS_PER_SITE
                                  )
+
+
+@override_settings(PAGINATION_MAX_PAGES=1)
+class CursorPaginatorViewsTests(TestCase):
+    NUM_POSTS_IN_TEST = 25
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        Post.objects.bulk_create(
+            Post(text=f'ТестовыйТекст{i}', author=cls.user)
+            for i in range(cls.NUM_POSTS_IN_TEST)
+        )
+        cls.ordered = list(Post.objects.order_by('-pub_date', '-pk'))
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_cursor_walks_all_posts_forward_and_back(self):
+        response = self.guest_client.get(reverse('posts:index'))
+        page_obj = response.context['page_obj']
+        self.assertTrue(page_obj.next_by_cursor)
+        seen = list(page_obj)
+        cursor = page_obj.next_cursor
+        while cursor:
+            response = self.guest_client.get(
+                reverse('posts:index'), {'cursor': cursor})
+            page_obj = response.context['page_obj']
+            seen += list(page_obj)
+            cursor = page_obj.next_cursor
+        self.assertEqual(seen, self.ordered)
+        response = self.guest_client.get(
+            reverse('posts:index'), {'cursor': page_obj.previous_cursor})
+        self.assertEqual(
+            list(response.context['page_obj']),
+            self.ordered[POSTS_PER_SITE:2 * POSTS_PER_SITE]
+        )
+
+    def test_page_numbers_out_of_range_are_not_found(self):
+        for page in (3, 0, -1):
+            with self.subTest(page=page):
+                response = self.guest_client.get(reverse('posts:index'),
+                                                 {'page': page})
+                self.assertEqual(response.status_code, 404)
+
+    def test_no_number_links_past_limit(self):
+        response = self.guest_client.get(reverse('posts:index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj.page_window), [1])
+        self.assertNotContains(response, '?page=2')
+        self.assertNotContains(response, 'Последняя')
+
+    def test_fragment_renders_only_posts(self):
+        response = self.guest_client.get(reverse(
+            'posts:profile_fragment', kwargs={'username': self.user}))
+        self.assertTemplateUsed(response, 'posts/includes/posts.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(list(response.context['page_obj']),
+                         self.ordered[:POSTS_PER_SITE])
+        self.assertContains(response, response.context['page_obj']
+                            .next_cursor)
+
+    def test_broken_cursor_opens_first_page(self):
+        response = self.guest_client.get(reverse('posts:index_fragment'),
+                                         {'cursor': 'broken'})
+        self.assertEqual(list(response.context['page_obj']),
+                         self.ordered[:POSTS_PER_SITE])
+
+
+class PostCountCacheTests(TransactionTestCase):
+    # Счётчики в кеше правятся в transaction.on_commit, который внутри
+    # транзакции TestCase не вызывается.
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.user = User.objects.create_user(username='TestUser')
+        self.group = Group.objects.create(title='Test', slug='test_slug')
+        self.other_group = Group.objects.create(title='Other', slug='other')
+
+    def paginator_count(self, url):
+        return self.guest_client.get(url).context['page_obj'].paginator.count
+
+    def test_count_follows_create_edit_and_delete(self):
+        group_url = reverse('posts:group_slug', kwargs={'slug': 'test_slug'})
+        other_url = reverse('posts:group_slug', kwargs={'slug': 'other'})
+        self.assertEqual(self.paginator_count(reverse('posts:index')), 0)
+        self.assertEqual(self.paginator_count(group_url), 0)
+        self.assertEqual(self.paginator_count(other_url), 0)
+        post = Post.objects.create(text='Текст', author=self.user,
+                                   group=self.group)
+        self.assertEqual(self.paginator_count(reverse('posts:index')), 1)
+        self.assertEqual(self.paginator_count(group_url), 1)
+        post.group = self.other_group
+        post.save()
+        self.assertEqual(self.paginator_count(group_url), 0)
+        self.assertEqual(self.paginator_count(other_url), 1)
+        Post.objects.get(pk=post.pk).delete()
+        self.assertEqual(self.paginator_count(reverse('posts:index')), 0)
+        self.assertEqual(self.paginator_count(other_url), 0)
+
+    def test_profile_count_comes_from_profile(self):
+        Post.objects.create(text='Текст', author=self.user)
+        Profile.objects.filter(user=self.user).update(post_count=7)
+        url = reverse('posts:profile', kwargs={'username': self.user})
+        self.assertEqual(self.paginator_count(url), 7)
+
+    @override_settings(PAGINATION_WINDOW=1)
+    def test_page_window_is_limited(self):
+        Post.objects.bulk_create(
+            Post(text=f'Текст{i}', author=self.user)
+            for i in range(POSTS_PER_SITE * 5)
+        )
+        response = self.guest_client.get(reverse('posts:index'),
+                                         {'page': 3})
+        self.assertEqual(list(response.context['page_obj'].page_window),
+                         [2, 3, 4])
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.group = Group.objects.create(title='Test', slug='test_slug')
+        cls.post = Post.objects.create(text='Текст', author=cls.user,
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.urls = {
+            reverse('posts:index'): 0,
+            reverse('posts:group_slug',
+                    kwargs={'slug': self.group.slug}): 1,
+            reverse('posts:profile', kwargs={'username': self.user}): 1,
+            reverse('posts:post_detail',
+                    kwargs={'post_id': self.post.pk}): 1,
+        }
+
+    def test_unchanged_page_answers_not_modified(self):
+        for url, queries in self.urls.items():
+            with self.subTest(url=url):
+                # Первый ответ с формой выдаёт CSRF-cookie, он входит в ETag.
+                self.authorized_client.get(url)
+                etag = self.authorized_client.get(url)['ETag']
+                # Сессия и пользователь плюс не больше одного запроса.
+                with self.assertNumQueries(2 + queries):
+                    response = self.authorized_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+
+    def test_guest_gets_not_modified_from_page_cache(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+
+    def test_follower_profile_etag_changes_after_follow(self):
+        author = User.objects.create_user(username='Author')
+        url = reverse('posts:profile', kwargs={'username': self.user})
+        self.authorized_client.get(url)
+        for action in ('posts:profile_follow', 'posts:profile_unfollow'):
+            with self.subTest(action=action):
+                etag = self.authorized_client.get(url)['ETag']
+                self.authorized_client.get(
+                    reverse(action, kwargs={'username': author})
+                )
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_etag_changes_after_comment(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.authorized_client.get(url)['ETag']
+        Comment.objects.create(text='Комментарий', author=self.user,
+                               post=self.post)
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class AuthorPostCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.other = User.objects.create_user(username='Other')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def post_count(self, user):
+        return Profile.objects.get(user=user).post_count
+
+    def test_count_follows_create_move_and_delete(self):
+        posts = [Post.objects.create(text='Текст', author=self.user)
+                 for _ in range(3)]
+        self.assertEqual(self.post_count(self.user), 3)
+        posts[0].author = self.other
+        posts[0].save()
+        posts[1].delete()
+        self.assertEqual(self.post_count(self.user), 1)
+        self.assertEqual(self.post_count(self.other), 1)
+        response = self.guest_client.get(
+            reverse('posts:profile', kwargs={'username': self.user})
+        )
+        self.assertContains(response, 'Всего постов: 1')
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': posts[2].pk})
+        )
+        self.assertContains(response, '<span >1</span>')
+
+    def test_repair_counters_fixes_post_count(self):
+        Post.objects.create(text='Текст', author=self.user)
+        Profile.objects.filter(user=self.user).update(post_count=5)
+        call_command('repair_counters', stdout=StringIO())
+        self.assertEqual(self.post_count(self.user), 1)
@@ -0,0 +1,249 @@
+"""Миниатюры картинок постов, построенные заранее.
+
+Раньше карточка поста уменьшала картинку тегом sorl {% thumbnail %} прямо
+во время отрисовки, и первый посетитель после загрузки ждал декодирования
+и ресайза. Теперь миниатюры строит отдельный процесс manage.py
+generate_thumbnails --loop, а шаблон показывает готовую миниатюру или,
+пока её нет (новые, старые и загруженные import_ndjson посты), прежний
+{% thumbnail %} sorl. С POST_THUMBNAIL_WORKERS > 0 post_create и
+post_edit ещё и ставят построение в пул потоков после фиксации
+транзакции; запись, упёршаяся в блокировку SQLite, повторяется.
+
+Для каждой картинки строится набор ширин POST_THUMBNAIL_WIDTHS в WebP и
+в формате, близком к исходному (JPEG или PNG), и шаблон отдаёт их через
+<picture> и srcset: телефон скачивает узкую WebP вместо JPEG на 990px.
+"""
+import hashlib
+import io
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import (IntegrityError, OperationalError, connections,
+                       transaction)
+from django.db.models import Exists, OuterRef, Q
+from PIL import Image, ImageOps, features
+
+from . import caching
+from .caching import list_tags
+from .models import Post, Thumbnail
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз повторять построение, упёршееся в блокировку базы, и пауза
+# перед первым повтором (дальше она удваивается).
+LOCKED_RETRIES = 5
+LOCKED_DELAY = 0.2
+
+_executor = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.POST_THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails'
+        )
+    return _executor
+
+
+def formats(transparent=False):
+    """Форматы миниатюр картинки: WebP и запасной для старых браузеров.
+
+    Запасной формат — JPEG, как у прежнего {% thumbnail %}; PNG только у
+    картинок с прозрачностью, которую JPEG потерял бы.
+    """
+    fallback = Thumbnail.PNG if transparent else Thumbnail.JPEG
+    if features.check('webp'):
+        return [Thumbnail.WEBP, fallback]
+    return [fallback]
+
+
+def sizes():
+    """(ширина, высота) миниатюр в пропорциях POST_THUMBNAIL_SIZE.
+
+    Первой идёт самая широкая.
+    """
+    base_width, base_height = settings.POST_THUMBNAIL_SIZE
+    return [(width, round(width * base_height / base_width))
+            for width in sorted(settings.POST_THUMBNAIL_WIDTHS,
+                                reverse=True)]
+
+
+def missing():
+    """Посты с картинкой, набор миниатюр которых не совпадает с нужным.
+
+    У поста должна быть миниатюра текущей картинки каждой ширины из
+    POST_THUMBNAIL_WIDTHS в WebP и в запасном формате (JPEG или PNG), и
+    не должно быть миниатюр других ширин.
+    """
+    widths = [width for width, _ in sizes()]
+    thumbnails = Thumbnail.objects.filter(post=OuterRef('pk'))
+    # Миниатюры прежней картинки не попадают в current, поэтому пост с
+    # новой картинкой и так окажется среди недостающих.
+    current = thumbnails.filter(source=OuterRef('image'))
+    annotations = {
+        'stale_thumbnails': Exists(thumbnails.exclude(width__in=widths)),
+    }
+    for width in widths:
+        for image_format in formats():
+            allowed = ([Thumbnail.WEBP] if image_format == Thumbnail.WEBP
+                       else [Thumbnail.JPEG, Thumbnail.PNG])
+            annotations[f'has_{image_format}_{width}'] = Exists(
+                current.filter(width=width, format__in=allowed)
+            )
+    complete = Q(**{name: name != 'stale_thumbnails'
+                    for name in annotations})
+    return (Post.objects.exclude(image='').annotate(**annotations)
+            .exclude(complete))
+
+
+def encode(image, image_format):
+    output = io.BytesIO()
+    if image_format == Thumbnail.WEBP:
+        image.save(output, 'WEBP',
+                   quality=settings.POST_THUMBNAIL_WEBP_QUALITY, method=4)
+    elif image_format == Thumbnail.PNG:
+        if image.mode == 'RGBA':
+            # Палитра из 256 цветов с прозрачностью в разы меньше RGBA.
+            image = image.quantize(256, method=Image.FASTOCTREE)
+        image.save(output, 'PNG', optimize=True)
+    else:
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(output, 'JPEG', quality=settings.POST_THUMBNAIL_QUALITY,
+                   optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def render(source, skip=()):
+    """Все миниатюры картинки из открытого файла за одно декодирование.
+
+    Картинка обрезается по центру до пропорций POST_THUMBNAIL_SIZE, как
+    делал {% thumbnail "990x339" crop="center" upscale=True %}, и
+    уменьшается до каждой ширины из POST_THUMBNAIL_WIDTHS. Возвращает
+    список (ширина, высота, формат, байты) всех нужных миниатюр; для пар
+    (ширина, формат) из skip байты не кодируются и равны None.
+    """
+    variants = sizes()
+    width, height = variants[0]
+    with Image.open(source) as image:
+        image_formats = formats('A' in image.mode
+                                or 'transparency' in image.info)
+        # JPEG можно сразу декодировать в 2, 4 или 8 раз меньше: это
+        # быстрее полного декодирования, а пикселей хватает для обрезки
+        # даже после поворота по EXIF.
+        scale = max(width, height) / min(image.size)
+        image.draft('RGB', (math.ceil(image.width * scale),
+                            math.ceil(image.height * scale)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            transparent = ('A' in image.mode
+                           or 'transparency' in image.info)
+            image = image.convert('RGBA' if transparent else 'RGB')
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    result = []
+    for width, height in variants:
+        # Каждая следующая ширина уменьшается из предыдущей, а не из
+        # исходной картинки.
+        image = image.resize((width, height), Image.LANCZOS)
+        for image_format in image_formats:
+            content = None
+            if (width, image_format) not in skip:
+                content = encode(image, image_format)
+            result.append((width, height, image_format, content))
+    return result
+
+
+class BrokenImage(Exception):
+    """Картинку поста нельзя прочитать: файла нет или он испорчен."""
+
+
+def generate(post_id):
+    """Строит недостающие миниатюры текущей картинки поста.
+
+    Миниатюры прежней картинки удаляются. Возвращает список новых
+    Thumbnail, пустой, если строить было нечего. Если картинку нельзя
+    прочитать, бросает BrokenImage.
+    """
+    post = (Post.objects.filter(pk=post_id)
+            .only('pk', 'image', 'author_id', 'group_id').first())
+    if post is None:
+        return []
+    for stale in post.thumbnails.exclude(source=post.image.name):
+        stale.delete()
+    if not post.image:
+        return []
+    existing = {(thumbnail.width, thumbnail.format): thumbnail
+                for thumbnail in post.thumbnails.all()}
+    try:
+        with post.image.open('rb') as source:
+            rendered = render(source, skip=existing)
+    except (OSError, Image.DecompressionBombError) as exc:
+        # UnidentifiedImageError (испорченный файл) — тоже OSError.
+        raise BrokenImage(f'пост {post_id}, {post.image.name}: {exc}')
+    needed = {(width, image_format)
+              for width, _, image_format, _ in rendered}
+    for key, thumbnail in existing.items():
+        # Ширину убрали из настроек или сменился формат картинки.
+        if key not in needed:
+            thumbnail.delete()
+    digest = hashlib.md5(post.image.name.encode()).hexdigest()[:12]
+    created = []
+    for width, _, image_format, content in rendered:
+        if content is None:
+            continue
+        thumbnail = Thumbnail(post=post, source=post.image.name,
+                              format=image_format)
+        thumbnail.image.save(
+            f'{post.pk}-{digest}-{width}.{image_format}',
+            ContentFile(content), save=False
+        )
+        try:
+            with transaction.atomic():
+                thumbnail.save()
+        except IntegrityError:
+            # Ту же миниатюру успел построить другой поток.
+            thumbnail.image.delete(save=False)
+            continue
+        created.append(thumbnail)
+    if created:
+        caching.bump(list_tags(post.group_id, post.author_id)
+                     + [f'post:{post.pk}'])
+    return created
+
+
+def _generate_retrying(post_id):
+    delay = LOCKED_DELAY
+    for _ in range(LOCKED_RETRIES):
+        try:
+            return generate(post_id)
+        except OperationalError as exc:
+            # SQLite отвечает «database is locked», пока пишет другой
+            # процесс или поток.
+            if 'locked' not in str(exc):
+                raise
+        time.sleep(delay)
+        delay *= 2
+    return generate(post_id)
+
+
+def _run(post_id):
+    try:
+        _generate_retrying(post_id)
+    except Exception:
+        logger.exception('Не удалось построить миниатюру поста %s', post_id)
+    finally:
+        # У каждого потока пула своё соединение с базой.
+        connections.close_all()
+
+
+def schedule(post):
+    """Ставит построение миниатюры в пул после фиксации транзакции."""
+    if settings.POST_THUMBNAIL_WORKERS:
+        post_id = post.pk
+        transaction.on_commit(lambda: _pool().submit(_run, post_id))
@@ -0,0 +1,82 @@
+"""Популярные посты.
+
+Очки популярности хранятся прямо в Post.trending_score и меняются
+точечными UPDATE: новый пост получает долю рейтинга автора, каждый
+комментарий добавляет TRENDING_COMMENT_WEIGHT. Команда decay_trending
+умножает все ненулевые очки на коэффициент затухания, поэтому старая
+активность постепенно перестаёт влиять. Вкладка популярного — один
+запрос по индексу (-trending_score, -id).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import (Case, F, FloatField, OuterRef, Q, Subquery,
+                              Value, When)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Post, Profile
+
+# Через столько периодов полураспада очки поста считаются нулевыми при
+# массовом засеве (2 ** -20 — меньше миллионной доли).
+MAX_HALF_LIVES = 20
+
+
+def seed(post):
+    rating = (Profile.objects.filter(user_id=post.author_id)
+              .values_list('rating', flat=True).first()) or 0
+    score = rating * settings.TRENDING_RATING_WEIGHT
+    if score:
+        Post.objects.filter(pk=post.pk).update(trending_score=score)
+
+
+def seed_many(posts, now=None):
+    """Засевает очки постов одним UPDATE, как сделали бы seed, comment_added
+    и decay_trending за время, прошедшее с публикации.
+
+    Для массовой загрузки старых постов: доля рейтинга автора и
+    комментарии (по comment_count) умножаются на затухание по возрасту
+    поста, взятое ступенями по четверти периода полураспада.
+    """
+    now = now or timezone.now()
+    half_life = timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+    steps = 4
+    rating = Subquery(
+        Profile.objects.filter(user_id=OuterRef('author_id'))
+        .values('rating')[:1],
+        output_field=FloatField()
+    )
+    score = (Coalesce(rating, 0) * settings.TRENDING_RATING_WEIGHT
+             + F('comment_count') * settings.TRENDING_COMMENT_WEIGHT)
+    factor = Case(
+        *(When(pub_date__gt=now - half_life * (step + 1) / steps,
+               then=Value(0.5 ** (step / steps)))
+          for step in range(MAX_HALF_LIVES * steps)),
+        default=Value(0.0),
+        output_field=FloatField()
+    )
+    posts.update(trending_score=score * factor)
+    (posts.filter(trending_score__gt=-settings.TRENDING_MIN_SCORE,
+                  trending_score__lt=settings.TRENDING_MIN_SCORE)
+     .exclude(trending_score=0).update(trending_score=0))
+
+
+def comment_added(post_id):
+    Post.objects.filter(pk=post_id).update(
+        trending_score=F('trending_score') + settings.TRENDING_COMMENT_WEIGHT
+    )
+
+
+def decay(hours):
+    """Состаривает очки на hours часов; возвращает число изменённых постов."""
+    factor = 0.5 ** (hours / settings.TRENDING_HALF_LIFE_HOURS)
+    posts = Post.objects.filter(~Q(trending_score=0))
+    posts.filter(trending_score__gt=-settings.TRENDING_MIN_SCORE / factor,
+                 trending_score__lt=settings.TRENDING_MIN_SCORE / factor,
+                 ).update(trending_score=0)
+    return posts.update(trending_score=F('trending_score') * factor)
+
+
+def top():
+    return (Post.objects.for_list().filter(trending_score__gt=0)
+            .order_by('-trending_score', '-id')[:settings.TRENDING_SIZE])
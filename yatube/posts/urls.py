@@ -6,9 +6,16 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('fragment/', views.index_fragment, name='index_fragment'),
     path('group/<slug:slug>/', views.group_posts, name='group_slug'),
+    path('group/<slug:slug>/fragment/',
+         views.group_fragment, name='group_fragment'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('profile/<str:username>/fragment/',
+         views.profile_fragment, name='profile_fragment'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('posts/<int:post_id>/comments/',
+         views.comments_fragment, name='comments_fragment'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/comment/',
@@ -20,4 +27,7 @@ urlpatterns = [
          views.profile_unfollow, name='profile_unfollow'),
     path('rating/<str:author>/inc', views.rating_inc, name='rat_inc'),
     path('rating/<str:author>/dec', views.rating_dec, name='rat_dec'),
+    path('trending/', views.trending_posts, name='trending'),
+    path('search/', views.post_search, name='search'),
+    path('leaderboard/', views.top_authors, name='leaderboard'),
 ]
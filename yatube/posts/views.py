@@ -1,85 +1,149 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import condition
 
-from yatube.settings import POSTS_PER_SITE, RATING_DELTA
-
+from . import (caching, feed, leaderboard, ratings, search, thumbnails,
+               trending)
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User, Rating, SetRating
-
-
-def pagination(request, all_post):
-    paginator = Paginator(all_post, POSTS_PER_SITE)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+from .models import Comment, Follow, Group, Post, User, Vote
+from .pagination import cursor_page, get_page
 
 
 def rating_change(request, author, delta):
     user = get_object_or_404(User, username=author)
-    if request.user != author:
-        SetRating.objects.get_or_create(user=request.user, author=author)
-
-    if Rating.objects.filter(author=user).exists():
-        rating = Rating.objects.get(author=user)
-        rating.rat += delta * RATING_DELTA
-        rating.save()
+    if request.user == user:
+        return
+    if settings.RATING_WRITE_BEHIND:
+        ratings.buffer_vote(request.user, user, delta)
     else:
-        rating = Rating.objects.create(rat=0, author=user)
-        rating.rat += delta * RATING_DELTA
-        rating.save()
+        ratings.record_vote(request.user, user, delta)
+
+
+def index_etag(request):
+    return caching.etag(request, ['index'])
+
+
+def group_etag(request, slug):
+    group_id = (Group.objects.filter(slug=slug)
+                .values_list('pk', flat=True).first())
+    if group_id is not None:
+        return caching.etag(request, [f'group:{group_id}'])
+
+
+def profile_etag(request, username):
+    author_id = (User.objects.filter(username=username)
+                 .values_list('pk', flat=True).first())
+    if author_id is not None:
+        return caching.etag(request, [f'author:{author_id}'])
+
+
+def post_etag(request, post_id):
+    author_id = (Post.objects.filter(pk=post_id)
+                 .values_list('author_id', flat=True).first())
+    if author_id is not None:
+        return caching.etag(request, [f'post:{post_id}',
+                                      f'author:{author_id}'])
+
 
+def tag_shown_posts(request, page_obj):
+    # Целую страницу кеширует middleware только для анонимов; выборка
+    # постов здесь нужна шаблону всё равно.
+    if not request.user.is_authenticated:
+        caching.tag_objects(request, caching.object_tags(page_obj))
 
+
+@condition(etag_func=index_etag)
 def index(request):
     template = 'posts/index.html'
-    posts = Post.objects.all()
-    rating = Rating.objects.all()
-    page_obj = pagination(request, posts)
+    caching.tag_request(request, ['index'])
+    posts = Post.objects.for_page()
+    page_obj = get_page(request, posts, 'index')
+    tag_shown_posts(request, page_obj)
     context = {
         'page_obj': page_obj,
-        'rating': rating,
+        'cache_version': caching.version_key(['index']),
+        'cache_timeout': settings.PAGE_CACHE_TIMEOUT,
     }
     return render(request, template, context)
 
 
+@condition(etag_func=group_etag)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = pagination(request, posts)
+    caching.tag_request(request, [f'group:{group.pk}'])
+    posts = group.posts.for_page()
+    page_obj = get_page(request, posts, f'group:{group.pk}')
+    tag_shown_posts(request, page_obj)
     context = {
         'group': group,
         'page_obj': page_obj,
+        'cache_version': caching.version_key([f'group:{group.pk}']),
+        'cache_timeout': settings.PAGE_CACHE_TIMEOUT,
     }
 
     return render(request, template, context)
 
 
+@condition(etag_func=profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    rating = Rating.objects.all()
-    page_obj = pagination(request, posts)
-    following = (request.user.is_authenticated
-                 and Follow.objects.filter(user=request.user, author=author)
-                 .exists())
-    if SetRating.objects.filter(user=request.user, author=author).exists():
-        vote = False
-    else:
-        vote = True
+    authors = User.objects.select_related('profile')
+    if request.user.is_authenticated:
+        authors = authors.annotate(is_following=Exists(
+            Follow.objects.filter(user=request.user, author=OuterRef('pk'))
+        ))
+    author = get_object_or_404(authors, username=username)
+    caching.tag_request(request, [f'author:{author.pk}'])
+    posts = author.posts.for_page()
+    page_obj = get_page(request, posts, count=author.profile.post_count)
+    tag_shown_posts(request, page_obj)
+    vote = author.pk not in Vote.objects.voted_authors(request.user,
+                                                       [author.pk])
     context = {
         'page_obj': page_obj,
         'author': author,
-        'posts': posts,
-        'following': following,
-        'rating': rating,
+        'following': getattr(author, 'is_following', False),
         'vote': vote,
+        'cache_version': caching.version_key([f'author:{author.pk}']),
+        'cache_timeout': settings.PAGE_CACHE_TIMEOUT,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def posts_fragment(request, posts):
+    """Отдаёт только разметку следующей порции постов для подгрузки."""
+    page_obj = cursor_page(posts, request.GET.get('cursor'),
+                           settings.POSTS_PER_SITE)
+    context = {
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/includes/posts_fragment.html', context)
+
+
+def index_fragment(request):
+    return posts_fragment(request, Post.objects.for_page())
+
+
+def group_fragment(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return posts_fragment(request, group.posts.for_page())
+
+
+def profile_fragment(request, username):
+    author = get_object_or_404(User, username=username)
+    return posts_fragment(request, author.posts.for_page())
+
+
+@condition(etag_func=post_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(Post.objects.for_page(), pk=post_id)
+    caching.tag_request(request, [f'post:{post.pk}',
+                                  f'author:{post.author_id}'])
+    comments = cursor_page(post.comments.select_related('author'), None,
+                           settings.COMMENTS_PER_PAGE, 'created')
     form = CommentForm()
     context = {
         'post': post,
@@ -89,6 +153,19 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def comments_fragment(request, post_id):
+    """Отдаёт разметку следующей порции комментариев к посту."""
+    comments = cursor_page(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        request.GET.get('cursor'), settings.COMMENTS_PER_PAGE, 'created'
+    )
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comments_fragment.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None,
@@ -98,6 +175,8 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if post.image:
+            thumbnails.schedule(post)
         return redirect('posts:profile', request.user)
     groups = Group.objects.all()
     return render(request, 'posts/create_post.html', {'form': form,
@@ -118,6 +197,8 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id)
     context = {
         'post': post,
@@ -137,17 +218,22 @@ def add_comment(request, post_id):
         comment.author = request.user
         comment.post = post
         comment.save()
+        if request.is_ajax():
+            return render(request, 'posts/includes/comments.html',
+                          {'comments': [comment]}, status=201)
+    elif request.is_ajax():
+        return render(request, 'posts/includes/comment_add.html',
+                      {'post': post, 'form': form}, status=400)
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    rating = Rating.objects.all()
-    page_obj = pagination(request, posts)
+    page_obj = feed.feed_page(request.user, Post.objects.for_page(),
+                              request.GET.get('cursor'),
+                              settings.POSTS_PER_SITE)
     context = {
         'page_obj': page_obj,
-        'rating': rating,
     }
     return render(request, 'posts/follow.html', context)
 
@@ -156,26 +242,58 @@ def follow_index(request):
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        # Подписка и счётчики подписок в профилях меняются вместе.
+        with transaction.atomic():
+            _, created = Follow.objects.get_or_create(user=request.user,
+                                                      author=author)
+        if created:
+            feed.backfill(request.user, author)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    follow = Follow.objects.get(user=request.user, author=author)
-    if request.user != author:
-        follow.delete()
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(user=request.user,
+                                           author=author).delete()
+    if deleted:
+        feed.remove(request.user, author)
     return redirect('posts:profile', username=username)
 
 
+def trending_posts(request):
+    context = {
+        'posts': trending.top().prefetch_related('thumbnails'),
+    }
+    return render(request, 'posts/trending.html', context)
+
+
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = search.search(query, request.GET.get('cursor'),
+                             settings.POSTS_PER_SITE)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def top_authors(request):
+    context = {
+        'authors': leaderboard.top(),
+    }
+    return render(request, 'posts/leaderboard.html', context)
+
+
+@login_required
 def rating_inc(request, author):
-    if not SetRating.objects.filter(user=request.user, author=author).exists():
-        rating_change(request, author, 1)
+    rating_change(request, author, Vote.UP)
     return redirect('posts:profile', username=author)
 
 
+@login_required
 def rating_dec(request, author):
-    if not SetRating.objects.filter(user=request.user, author=author).exists():
-        rating_change(request, author, -1)
+    rating_change(request, author, Vote.DOWN)
     return redirect('posts:profile', username=author)
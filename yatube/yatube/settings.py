@@ -35,10 +35,82 @@ ALLOWED_HOSTS = [
 # Global vars
 # Paginator
 POSTS_PER_SITE = 10
+# Сколько страниц открывается по номеру; дальше листаем курсором
+PAGINATION_MAX_PAGES = 10
+# Сколько номеров страниц показывать по обе стороны от текущей
+PAGINATION_WINDOW = 3
+# Сколько секунд хранить в кеше число постов ленты
+POST_COUNT_TIMEOUT = 60 * 60 * 24
+# Сколько секунд хранить фрагменты лент: они устаревают по поколениям
+# (posts.caching), так что срок нужен только для вытеснения
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
 
 #Rating delta
 RATING_DELTA = 1
 
+# Лента подписок: сколько записей хранить на пользователя, сколько
+# подписчиков обрабатывать за раз и у каких авторов (по числу
+# подписчиков) посты не раскладываются, а читаются при запросе ленты
+FEED_MAX_ITEMS = 1000
+FEED_BATCH_SIZE = 500
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_CELEBRITIES_TIMEOUT = 60 * 5
+
+# Отложенная запись голосов: голоса копятся в журнале и переносятся
+# в базу пачками (manage.py flush_ratings или по порогу RATING_BUFFER_SIZE)
+RATING_WRITE_BEHIND = False
+RATING_BUFFER_PATH = os.path.join(BASE_DIR, 'rating_buffer.log')
+RATING_BUFFER_SIZE = 100
+RATING_FLUSH_INTERVAL = 5
+
+# Рейтинг с затуханием: вес голоса падает вдвое каждые
+# RATING_HALF_LIFE_DAYS дней (manage.py decay_ratings). При
+# RATING_USE_DECAYED на страницах показывается он вместо суммы голосов
+RATING_HALF_LIFE_DAYS = 30
+RATING_USE_DECAYED = False
+
+# Таблица лидеров: сколько авторов показывать на странице и в шапке
+# и через сколько секунд перестраивать её целиком
+LEADERBOARD_SIZE = 50
+LEADERBOARD_WIDGET_SIZE = 3
+LEADERBOARD_TIMEOUT = 60 * 60
+
+# Сколько комментариев выводить на странице поста сразу и подгружать
+# за один запрос
+COMMENTS_PER_PAGE = 20
+
+# JSON API: наибольший размер страницы (?limit=) и число постов,
+# которые можно запросить одним ?ids=
+API_MAX_LIMIT = 100
+API_MAX_IDS = 100
+
+# Выгрузка постов: сколько строк читать из базы за один запрос
+EXPORT_CHUNK_SIZE = 2000
+
+# Миниатюры картинок постов строит заранее manage.py generate_thumbnails
+# --loop, проверяющий новые посты каждые POST_THUMBNAIL_INTERVAL секунд.
+# POST_THUMBNAIL_WORKERS > 0 строит их ещё и в потоках веб-процесса: с
+# SQLite такие записи конкурируют с запросами за блокировку базы. Каждая
+# картинка уменьшается до ширин POST_THUMBNAIL_WIDTHS в пропорциях
+# POST_THUMBNAIL_SIZE, в WebP и в исходном формате
+POST_THUMBNAIL_SIZE = (990, 339)
+POST_THUMBNAIL_WIDTHS = (330, 660, 990)
+POST_THUMBNAIL_QUALITY = 85
+POST_THUMBNAIL_WEBP_QUALITY = 75
+POST_THUMBNAIL_WORKERS = 0
+POST_THUMBNAIL_INTERVAL = 10
+
+# Популярные посты: комментарий прибавляет к очкам поста
+# TRENDING_COMMENT_WEIGHT, новый пост начинает с рейтинга автора,
+# умноженного на TRENDING_RATING_WEIGHT. Очки падают вдвое каждые
+# TRENDING_HALF_LIFE_HOURS часов (manage.py decay_trending), очки меньше
+# TRENDING_MIN_SCORE обнуляются. На вкладке TRENDING_SIZE постов
+TRENDING_COMMENT_WEIGHT = 1.0
+TRENDING_RATING_WEIGHT = 0.1
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_MIN_SCORE = 0.01
+TRENDING_SIZE = 50
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -52,6 +124,7 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
 ]
 
@@ -62,6 +135,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.AnonymousPageCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -79,6 +153,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.top_authors.top_authors',
             ],
         },
     },